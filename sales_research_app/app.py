@@ -1,10 +1,14 @@
 import streamlit as st
 import os
-from modules import auth, gemini, extractor, gdrive
+from modules import auth, tracing, warmup
 print("DEBUG: App is starting...")
 
 st.set_page_config(page_title="Sales Research Assistant", layout="centered")
 
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+
+tracing.start_metrics_server() # No-op unless TRACING_ENABLED is set; started once per process
+
 # --- Google Authentication Setup & Callback Handling ---
 if 'redirect_uri' not in st.session_state:
     st.session_state['redirect_uri'] = os.getenv("REDIRECT_URI", "http://localhost:8501")
@@ -12,47 +16,70 @@ if 'redirect_uri' not in st.session_state:
 # Check for authorization code in query parameters after redirect
 query_params = st.query_params
 if "code" in query_params and "state" in query_params:
-    # Ensure query_params are accessed correctly (they are dict-like, values are lists)
-    auth_code = query_params.get("code")[0] if query_params.get("code") else None
-    auth_state = query_params.get("state")[0] if query_params.get("state") else None
+    # Query param values are strings. The state is checked against the shared state backend
+    # rather than this session, since the callback may land on another replica or browser tab,
+    # and against the nonce cookie of the browser that started the sign-in
+    auth_code = query_params.get("code")
+    auth_state = query_params.get("state")
+    try:
+        credentials = auth.fetch_tokens(auth_code, auth_state, auth.get_cookie(auth.OAUTH_NONCE_COOKIE))
+        # Clear query params after the token fetch to prevent re-processing
+        st.query_params.clear()
+        if credentials:
+            # Rerun to reflect authenticated state immediately
+            st.rerun()
+        st.error("OAuth state mismatch or expired sign-in request. Please try signing in again.")
+    except Exception as e:
+        st.error(f"Error during Google sign-in: {e}")
+        st.query_params.clear() # Clear params on error too
+elif not auth.is_authenticated() and auth.get_cookie(auth.SESSION_COOKIE):
+    # New browser session (reload, or routed to another replica): restore the stored sign-in.
+    # An expired session, or one signed out elsewhere, has its cookie cleared below
+    auth.restore_session(auth.get_cookie(auth.SESSION_COOKIE))
 
-    if auth_code and auth_state == st.session_state.get('oauth_state'):
-        try:
-            auth.fetch_tokens(auth_code)
-            # Clear query params after successful token fetch to prevent re-processing
-            st.query_params.clear()
-            # Rerun to reflect authenticated state immediately and remove params from URL
-            st.experimental_rerun()
-        except Exception as e:
-            st.error(f"Error during Google sign-in: {e}")
-            st.query_params.clear() # Clear params on error too
-    elif auth_state and auth_state != st.session_state.get('oauth_state'):
-        st.error("OAuth state mismatch. Please try signing in again.")
-        st.query_params.clear() # Clear params on state mismatch
+auth.sync_session_cookie()
 
 # --- Main Application Logic: Conditional display based on authentication ---
 if auth.is_authenticated():
     # --- Authenticated View ---
+    # The research modules pull in Gemini, trafilatura and the Drive client; they are only
+    # imported once a user is signed in (and are usually already loaded by the warm-up)
+    from modules import gemini, cache, batch, jobs, article_store
     st.title("Sales Research Assistant")
 
     credentials = auth.get_credentials() # Get fresh or refreshed credentials
     if 'user_info' not in st.session_state or not st.session_state.get('user_info'): # Fetch if not in session or empty
         if credentials:
             st.session_state['user_info'] = auth.get_user_info(credentials)
+            auth.save_session()
         else: # Should not happen if authenticated, but as a safeguard
             auth.sign_out()
-            st.experimental_rerun() # Force re-check of authentication
+            st.query_params.clear()
+            st.rerun() # Force re-check of authentication
 
     if st.session_state.get('user_info'):
         st.sidebar.success(f"Signed in as {st.session_state['user_info'].get('email')}")
         if st.sidebar.button("Sign Out", key="sidebar_sign_out_button"):
             auth.sign_out()
-            st.experimental_rerun()
+            st.query_params.clear()
+            st.rerun()
     else:
         st.sidebar.warning("Authenticated, but could not retrieve user info.")
         if st.sidebar.button("Sign Out", key="sidebar_sign_out_error_button"):
             auth.sign_out()
-            st.experimental_rerun()
+            st.query_params.clear()
+            st.rerun()
+
+    cache_stats = cache.get_cache().stats()
+    st.sidebar.caption(
+        f"Cache: {sum(cache_stats['hits'].values())} hits, {sum(cache_stats['misses'].values())} misses, "
+        f"{cache_stats['entries']} entries"
+    )
+    store_stats = article_store.get_store().stats()
+    st.sidebar.caption(
+        f"Articles: {store_stats['urls']} URLs, {store_stats['blobs']} stored "
+        f"({store_stats['bytes'] / (1024 * 1024):.1f} MB compressed)"
+    )
 
     st.markdown("---") # Separator
 
@@ -60,49 +87,145 @@ if auth.is_authenticated():
     company_name = st.text_input("Enter Company Name", key="company_name_input")
 
     # Start Research button - auth check is implicitly handled by being in this block
+    force_refresh = st.checkbox("Force refresh (ignore cached results)", key="force_refresh_checkbox")
+    incremental = st.checkbox("Incremental refresh (update the last saved Drive folder)", key="incremental_checkbox",
+                              help="Fetches only articles that are new since the last run, updates changed files in place "
+                                   "and adds a summary of what changed. Runs as a background job.")
+    stream_results = st.checkbox("Show results as they arrive", value=True, key="stream_results_checkbox",
+                                 help="Streams research into the page while it runs. Unchecked, research runs as a background job.")
     start_research_button = st.button("Start Research", key="start_research_button", disabled=not company_name)
 
     # Placeholders for messages, defined within the authenticated scope
     status_message_placeholder = st.empty()
-    drive_link_placeholder = st.empty()
+
+    # Research runs on the background job queue, so reruns and refreshes don't kill it
+    job_queue = jobs.get_job_queue()
+    # Jobs are listed and cancelled per owner. Without user info, the owner is this sign-in's
+    # session, never a name shared with other users
+    job_user = (st.session_state.get('user_info') or {}).get('email') or (
+        f"session:{st.session_state['session_id']}" if st.session_state.get('session_id') else None
+    )
+
+    def submit_job(title, fn, *args, dedup_key=None, **kwargs):
+        """Submits a job for the signed-in user, showing an error if it cannot be queued."""
+        if not job_user:
+            status_message_placeholder.error("Could not identify your Google account. Please sign out and sign in again.")
+            return
+        current_credentials = auth.get_credentials() # Re-check credentials before sensitive operations
+        if not current_credentials:
+            status_message_placeholder.error("Google credentials became invalid. Please sign out and sign in again.")
+            return
+        try:
+            job_queue.submit(job_user, title, fn, *args, credentials=current_credentials, dedup_key=dedup_key, **kwargs)
+        except jobs.JobLimitError as e:
+            status_message_placeholder.error(str(e))
+
+    def stream_research(company_name):
+        """
+        Renders research as each part arrives: overview tokens, then competitors, then each
+        extracted article. The Drive upload runs as a background job afterwards.
+        """
+        research_results = None if force_refresh else cache.get_cached_research(company_name)
+        st.subheader(company_name)
+        st.markdown("#### Overview")
+        if research_results:
+            st.markdown(research_results["overview"])
+        else:
+            try:
+                # The structured research request runs in the background while the overview streams
+                research_future = gemini.submit_research(company_name)
+            except Exception as e:
+                st.error(f"Error interacting with Gemini API: {e}")
+                return
+            stream_errors = {}
+            streamed_overview = st.write_stream(gemini.stream_overview(company_name, stream_errors))
+            with st.spinner("Waiting for competitors and articles from Gemini..."):
+                research_results = gemini.collect_research(research_future)
+            if streamed_overview and not stream_errors:
+                # Keep the overview the user has already read
+                research_results["overview"] = streamed_overview
+                research_results["errors"].pop("overview", None)
+            else:
+                st.markdown(research_results["overview"])
+            for name, error in research_results["errors"].items():
+                st.warning(f"Gemini {name} request failed: {error}")
+            cache.store_research(company_name, research_results)
+
+        st.markdown("#### Competitors")
+        st.markdown("\n".join(f"- {name}" for name in research_results.get("competitors", [])) or "No competitors found.")
+
+        st.markdown("#### Articles")
+        article_urls = [article['url'] for article in research_results.get('articles', []) if article.get('url')]
+        extracted_by_url = {}
+        if not article_urls:
+            st.warning("No articles found by Gemini research.")
+        with st.spinner("Extracting content from articles..."):
+            for article, messages in cache.iter_cached_extracted_articles(article_urls, force_refresh=force_refresh):
+                if article:
+                    extracted_by_url[article['url']] = article
+                    with st.expander(article['url']):
+                        st.markdown(article['markdown_content'])
+                else:
+                    level, message = messages[-1]
+                    getattr(st, level)(message)
+
+        # Keep Gemini's article order for the files saved to Drive
+        extracted_articles = [extracted_by_url[url] for url in article_urls if url in extracted_by_url]
+        submit_job(f"Save to Drive: {company_name}", jobs.save_to_drive, company_name, research_results, extracted_articles)
+        st.info("Saving to Google Drive in the background. The link will appear under Research Jobs below.")
 
     if start_research_button:
         if not company_name:
             status_message_placeholder.error("Please enter a company name to start research.")
+        elif incremental:
+            submit_job(f"Refresh: {company_name}", jobs.refresh_and_save, company_name, force_refresh=force_refresh,
+                       dedup_key=f"refresh:{cache.normalize_company_name(company_name)}")
+        elif stream_results:
+            with tracing.trace_run(f"stream {company_name}"):
+                stream_research(company_name)
         else:
-            status_message_placeholder.info(f"Starting research for {company_name}...")
-            
-            with st.spinner("Researching company information with Gemini..."):
-                research_results = gemini.research_company(company_name)
-            
-            if research_results:
-                status_message_placeholder.success("Gemini research complete!")
-                
-                article_urls = [article['url'] for article in research_results.get('articles', []) if article.get('url')]
-                extracted_articles = []
-                if article_urls:
-                    with st.spinner("Extracting content from articles..."):
-                        extracted_articles = extractor.extract_content_from_urls(article_urls)
-                    if extracted_articles: # Check if any articles were successfully extracted
-                        status_message_placeholder.success(f"Extracted content from {len(extracted_articles)} articles.")
+            submit_job(f"Research: {company_name}", jobs.research_and_save, company_name, force_refresh=force_refresh,
+                       dedup_key=f"research:{cache.normalize_company_name(company_name)}")
+
+    st.markdown("---")
+    with st.expander("Batch research (CSV upload)"):
+        st.caption("Upload a CSV with a 'company' column, or one company name per row. Re-uploading the same list resumes it.")
+        companies_csv = st.file_uploader("Companies CSV", type=["csv"], key="batch_csv_uploader")
+        companies = batch.read_companies_csv(companies_csv) if companies_csv else []
+        if companies:
+            st.write(f"{len(companies)} companies found.")
+        if st.button("Start Batch Research", key="start_batch_button", disabled=not companies):
+            submit_job(f"{'Refresh' if incremental else 'Batch'}: {len(companies)} companies", batch.batch_job, companies,
+                       force_refresh=force_refresh, incremental=incremental,
+                       dedup_key=f"batch:{batch.default_checkpoint_path(companies, incremental)}")
+
+    @st.fragment(run_every=JOB_POLL_SECONDS)
+    def show_research_jobs():
+        """Polls the job queue and renders the user's recent jobs."""
+        for job in job_queue.list_jobs(job_user, limit=5) if job_user else []:
+            active = job['status'] in jobs.ACTIVE_STATUSES
+            with st.expander(f"{job['title']} ({job['status']})", expanded=active):
+                if active and st.button("Cancel", key=f"cancel_job_{job['id']}"):
+                    job_queue.cancel(job['id'])
+                result = job.get('result') or {}
+                if result.get('drive_link'):
+                    st.success("Research complete! Files saved to Google Drive.")
+                    st.markdown(f"**[View in Google Drive]({result['drive_link']})**")
+                if result.get('summary'):
+                    st.caption(f"Changes since the last run: {result['summary']}")
+                for entry in result.get('companies', []):
+                    if entry.get('status') == 'done':
+                        st.markdown(f"- [{entry['company']}]({entry.get('drive_link')})")
                     else:
-                        status_message_placeholder.info("No content could be extracted from the found articles.")
-                else:
-                    status_message_placeholder.warning("No articles found by Gemini research.")
-
-                current_credentials = auth.get_credentials() # Re-check credentials before sensitive operations
-                if current_credentials:
-                    with st.spinner("Saving results to Google Drive..."):
-                        drive_link = gdrive.save_research_to_drive(current_credentials, company_name, research_results, extracted_articles)
-                        if drive_link:
-                            drive_link_placeholder.success("Research complete! Files saved to Google Drive.")
-                            drive_link_placeholder.markdown(f"**[View in Google Drive]({drive_link})**")
-                        else:
-                            status_message_placeholder.error("Failed to save to Google Drive.")
-                else:
-                    status_message_placeholder.error("Google credentials became invalid. Please sign out and sign in again.")
-            else:
-                status_message_placeholder.error("Gemini research failed. Please try again.")
+                        st.markdown(f"- {entry['company']}: {entry.get('status')} at {entry.get('stage')} ({entry.get('error')})")
+                if job.get('error'):
+                    st.error(job['error'])
+                for level, message in job_queue.events(job['id'], limit=15 if active else 5):
+                    st.caption(f"{level.upper()}: {message}")
+
+    st.markdown("---")
+    st.subheader("Research Jobs")
+    show_research_jobs()
 else:
     # --- Unauthenticated View ---
     st.title("Sales Research Assistant")
@@ -123,4 +246,9 @@ else:
                 # st.stop() # Removed to prevent session state issues
 
     st.markdown("---")
-    st.caption("This application requires Google authentication to access its features and save research data to your Google Drive.")
\ No newline at end of file
+    st.caption("This application requires Google authentication to access its features and save research data to your Google Drive.")
+
+    # Load the research modules in the background while the user signs in. Parse workers
+    # import this script as their main module ("__mp_main__") and must not start a pool of their own.
+    if __name__ == "__main__":
+        warmup.start()
\ No newline at end of file
@@ -0,0 +1,70 @@
+"""
+Headless batch research: runs every company in a CSV through Gemini research,
+article extraction and Google Drive upload.
+
+Usage:
+    python batch_cli.py companies.csv --credentials token.json
+    python batch_cli.py watchlist.csv --credentials token.json --incremental
+
+`token.json` holds authorized-user OAuth credentials (client_id, client_secret,
+refresh_token) for the Drive account the results are saved to. Re-running the
+same command resumes from the checkpoint file. With --incremental, companies that
+already have a research folder in Drive are refreshed in place (see modules/gdrive.py).
+"""
+import sys
+import argparse
+
+from google.oauth2.credentials import Credentials
+
+from modules import batch
+from modules.scopes import SCOPES
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch company research to Google Drive.")
+    parser.add_argument("csv_path", help="CSV file with a 'company' column (or company names in the first column).")
+    parser.add_argument("--credentials", required=True, help="Authorized-user OAuth credentials JSON file.")
+    parser.add_argument("--checkpoint", help="Checkpoint file (defaults to one derived from the company list).")
+    parser.add_argument("--force-refresh", action="store_true", help="Ignore cached research and article content.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Refresh each company's last saved Drive folder instead of creating a new one.")
+    parser.add_argument("--research-workers", type=int, default=batch.RESEARCH_WORKERS)
+    parser.add_argument("--extract-workers", type=int, default=batch.EXTRACT_WORKERS)
+    parser.add_argument("--upload-workers", type=int, default=batch.UPLOAD_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=batch.QUEUE_SIZE)
+    args = parser.parse_args(argv)
+
+    with open(args.csv_path, newline="") as f:
+        companies = batch.read_companies_csv(f)
+    if not companies:
+        print("No companies found in CSV.", file=sys.stderr)
+        return 1
+
+    credentials = Credentials.from_authorized_user_file(args.credentials, SCOPES)
+    checkpoint_path = args.checkpoint or batch.default_checkpoint_path(companies, args.incremental)
+    print(f"{'Refreshing' if args.incremental else 'Researching'} {len(companies)} companies (checkpoint: {checkpoint_path})")
+
+    def on_progress(company, stage, status, detail):
+        print(f"[{stage}] {company}: {status}" + (f" ({detail})" if detail else ""), flush=True)
+
+    state = batch.run_batch(
+        companies, credentials,
+        checkpoint_path=checkpoint_path,
+        force_refresh=args.force_refresh,
+        incremental=args.incremental,
+        research_workers=args.research_workers,
+        extract_workers=args.extract_workers,
+        upload_workers=args.upload_workers,
+        queue_size=args.queue_size,
+        progress_callback=on_progress
+    )
+
+    failed = [entry["company"] for entry in state.values() if entry.get("status") != "done"]
+    print(f"Done: {len(state) - len(failed)} succeeded, {len(failed)} failed.")
+    for company in failed:
+        print(f"  FAILED: {company}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
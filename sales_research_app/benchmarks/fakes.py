@@ -0,0 +1,472 @@
+"""
+Local stand-ins for the external services used by the research pipeline:
+a fake Gemini model, an HTTP server for saved article pages, a fake
+Google Drive v3 endpoint and an in-memory Redis. All servers bind to
+127.0.0.1 on a free port.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import re
+import hashlib
+import threading
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from google.api_core.exceptions import ServiceUnavailable
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def load_gemini_responses(names=None):
+    """Loads recorded Gemini responses from corpus/gemini as {name: text}."""
+    directory = os.path.join(CORPUS_DIR, "gemini")
+    responses = {}
+    for file_name in sorted(os.listdir(directory)):
+        name = os.path.splitext(file_name)[0]
+        if file_name.endswith(".json") and (names is None or name in names):
+            with open(os.path.join(directory, file_name)) as f:
+                responses[name] = json.load(f)["text"]
+    return responses
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def __iter__(self):
+        # Streaming responses yield a handful of chunks
+        words = self.text.split(" ")
+        for i in range(0, len(words), 8):
+            yield _FakeResponse(" ".join(words[i:i + 8]) + " ")
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the redis-py client, covering what state.RedisStateBackend uses
+    (get, set with ex/nx, getdel, delete, and eval of its compare-and-delete script). One
+    instance shared by several backends acts like replicas talking to the same server.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        value, expires_at = self._data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return None
+            self._data[key] = (value, time.time() + ex if ex else None)
+            return True
+
+    def getdel(self, key):
+        with self._lock:
+            value = self._live(key)
+            self._data.pop(key, None)
+            return value
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def eval(self, script, numkeys, *keys_and_args):
+        from modules.state import RedisStateBackend
+        if script != RedisStateBackend.DELETE_IF_EQUALS_SCRIPT:
+            raise NotImplementedError("FakeRedis only runs the compare-and-delete script")
+        key, value = keys_and_args
+        with self._lock:
+            if self._live(key) != value:
+                return 0
+            del self._data[key]
+            return 1
+
+
+class FakeGeminiModel:
+    """
+    Stand-in for genai.GenerativeModel. Replies with recorded responses (with
+    {company} and {base_url} filled in) after `latency` seconds (+/- `jitter`),
+    and raises ServiceUnavailable (503) for a `failure_rate` fraction of calls.
+    """
+
+    def __init__(self, base_url, responses=None, latency=0.5, jitter=0.2, failure_rate=0.0, seed=None):
+        self.base_url = base_url.rstrip("/")
+        self.responses = responses or load_gemini_responses()
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            self.calls["stream" if stream else "generate"] += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.failure_rate
+            name = self._random.choice(sorted(self.responses))
+        time.sleep(delay)
+        if fail:
+            with self._lock:
+                self.calls["failed"] += 1
+            raise ServiceUnavailable("The model is overloaded. Please try again later.")
+        company = prompt.split("company ", 1)[-1].split(".")[0] if "company " in prompt else "Acme Corp"
+        text = self.responses[name].replace("{base_url}", self.base_url).replace("{company}", company)
+        return _FakeResponse(text)
+
+
+class _CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, kind):
+        with self.lock:
+            self.requests[kind] += 1
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (e.g. a truncated download) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+def _start(server):
+    threading.Thread(target=server.serve_forever, name=type(server).__name__, daemon=True).start()
+    return server
+
+
+class _ArticleHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _page(self, name):
+        path = os.path.join(CORPUS_DIR, "pages", os.path.basename(name.split("?")[0]))
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def do_GET(self):
+        server = self.server
+        kind, _, name = self.path.lstrip("/").partition("/")
+        server.count(kind)
+        if kind == "pages":
+            body = self._page(name)
+            if not body:
+                self._send(404, b"Not found")
+                return
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                server.count("not_modified")
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+        elif kind == "slow":
+            time.sleep(server.slow_delay)
+            self._send(200, self._page(name) or b"")
+        elif kind == "huge":
+            # Endless-feed style page: a real article followed by megabytes of filler
+            filler = b"<p>" + b"filler text " * 80 + b"</p>\n"
+            repeats = server.huge_bytes // len(filler)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(self._page(name) or b"") + repeats * len(filler)))
+            self.end_headers()
+            self.wfile.write(self._page(name) or b"")
+            try:
+                for _ in range(repeats):
+                    self.wfile.write(filler)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        elif kind == "pdf":
+            self._send(200, b"%PDF-1.4\n" + b"0" * 200000, content_type="application/pdf")
+        elif kind == "flaky":
+            # /flaky/<status>/<failures>/<file> answers <status> to the first <failures> requests
+            status, failures, page = name.split("/", 2)
+            with server.lock:
+                server.attempts[self.path] += 1
+                attempt = server.attempts[self.path]
+            if attempt <= int(failures):
+                self.send_response(int(status))
+                self.send_header("Retry-After", str(server.retry_after))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            else:
+                self._send(200, self._page(page) or b"")
+        elif kind == "redirect":
+            # /redirect/<hops>/<file> redirects <hops> times before serving /pages/<file>
+            hops, _, page = name.partition("/")
+            location = f"/redirect/{int(hops) - 1}/{page}" if int(hops) > 1 else f"/pages/{page}"
+            self.send_response(302)
+            self.send_header("Location", location)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif kind == "error":
+            status = int(name) if name.isdigit() else 500
+            self._send(status, b"<html><body>Error</body></html>")
+        else:
+            self._send(404, b"Not found")
+
+
+def start_article_server(slow_delay=2.0, huge_bytes=20 * 1024 * 1024, retry_after=0):
+    """
+    Serves corpus/pages at /pages/<file> (with an ETag, answering 304 to a matching
+    If-None-Match), the same pages after `slow_delay` seconds at
+    /slow/<file>, a page padded to `huge_bytes` at /huge/<file>, a PDF at /pdf/<name>,
+    redirect chains at /redirect/<hops>/<file> and error statuses at /error/<status>.
+    /flaky/<status>/<failures>/<file> answers <status> (with Retry-After: `retry_after`)
+    to the first <failures> requests for that path, then serves the page.
+    """
+    server = _CountingServer(_ArticleHandler)
+    server.slow_delay = slow_delay
+    server.huge_bytes = huge_bytes
+    server.retry_after = retry_after
+    server.attempts = Counter()
+    return _start(server)
+
+
+class _DriveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _metadata(self, body):
+        """Extracts the JSON metadata part from a JSON or multipart/related request body."""
+        return self._parts(body)[0]
+
+    def _parts(self, body):
+        """Returns (metadata, media bytes or None) from a JSON, multipart/related or media request body."""
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/related"):
+            boundary = content_type.split("boundary=")[-1].strip('"').encode()
+            metadata, media = {}, None
+            for part in body.split(b"--" + boundary):
+                # googleapiclient separates part headers with bare "\n", other clients with "\r\n"
+                headers, _, payload = part.replace(b"\r\n", b"\n").partition(b"\n\n")
+                if b"application/json" in headers and not metadata:
+                    metadata = json.loads(payload.strip())
+                elif b"Content-Type" in headers:
+                    media = payload[:-1] if payload.endswith(b"\n") else payload
+            return metadata, media
+        if "uploadType=media" in self.path:
+            return {}, body
+        return (json.loads(body) if body.strip() else {}), None
+
+    @staticmethod
+    def _matches(entry, query):
+        """Evaluates the 'and'-joined clauses of a Drive query the app uses against a file entry."""
+        for clause in re.split(r"\s+and\s+", query):
+            field, operator, value = re.match(r"\s*(\S+)\s*(=|contains|in)\s*(.*?)\s*$", clause).groups()
+            if operator == "in":
+                if field.strip("'") not in entry.get("parents", []):
+                    return False
+                continue
+            value = value.strip("'").replace("\\'", "'")
+            if field == "trashed":
+                if entry.get("trashed", False) != (value == "true"):
+                    return False
+            elif operator == "contains":
+                if value.casefold() not in entry.get(field, "").casefold():
+                    return False
+            elif entry.get(field) != value:
+                return False
+        return True
+
+    def _scripted_error(self):
+        """Answers with the next scripted error status, or a random one at `error_rate`. Returns True if it did."""
+        server = self.server
+        with server.lock:
+            if server.scripted_errors:
+                status = server.scripted_errors.popleft()
+            elif server.error_rate and server.random.random() < server.error_rate:
+                status = server.random.choice((429, 503))
+            else:
+                return False
+            server.requests[f"error.{status}"] += 1
+        body = json.dumps({"error": {"code": status, "message": "Rate limit exceeded" if status == 429 else "Backend Error"}}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Retry-After", str(server.retry_after))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return True
+
+    def _create(self, metadata, size=0, content=None):
+        server = self.server
+        file_id = uuid.uuid4().hex
+        entry = dict(metadata, id=file_id, size=size, webViewLink=f"https://drive.example.test/{file_id}")
+        if content is not None:
+            server.contents[file_id] = content
+        entry.setdefault("mimeType", "application/octet-stream")
+        with server.lock:
+            server.files[file_id] = entry
+        return entry
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        if self._scripted_error():
+            return
+        path = self.path.split("?")[0]
+        if path.endswith("/about"):
+            server.count("about.get")
+            self._send_json(200, {"user": {"permissionId": server.permission_id}})
+        elif path.endswith("/files"):
+            server.count("files.list")
+            with server.lock:
+                files = list(server.files.values())
+            query = parse_qs(urlsplit(self.path).query).get("q", [""])[0]
+            matches = [f for f in files if self._matches(f, query)]
+            self._send_json(200, {"files": [
+                {"id": f["id"], "name": f["name"], "webViewLink": f["webViewLink"]} for f in matches
+            ]})
+        elif "alt=media" in self.path:
+            server.count("files.get_media")
+            file_id = path.rsplit("/", 1)[-1]
+            with server.lock:
+                content = server.contents.get(file_id)
+            if content is None:
+                self._send_json(404, {"error": {"code": 404, "message": "File not found"}})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            server.count("files.get")
+            file_id = path.rsplit("/", 1)[-1]
+            with server.lock:
+                entry = server.files.get(file_id)
+            self._send_json(200, entry) if entry else self._send_json(404, {"error": {"code": 404, "message": "File not found"}})
+
+    def do_POST(self):
+        server = self.server
+        body = self._read_body()
+        time.sleep(server.latency)
+        if self._scripted_error():
+            return
+        if "uploadType=resumable" in self.path:
+            server.count("files.create.resumable")
+            entry = self._create(self._metadata(body))
+            self.send_response(200)
+            self.send_header("Location", f"{server.base_url}/upload/session/{entry['id']}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path.startswith("/upload/"):
+            server.count("files.create.multipart")
+            metadata, media = self._parts(body)
+            self._send_json(200, self._create(metadata, size=len(body), content=media))
+        else:
+            metadata = self._metadata(body)
+            if metadata.get("mimeType") == "application/vnd.google-apps.shortcut":
+                server.count("files.create.shortcut")
+                with server.lock:
+                    target_exists = metadata.get("shortcutDetails", {}).get("targetId") in server.files
+                if not target_exists:
+                    self._send_json(404, {"error": {"code": 404, "message": "Shortcut target not found"}})
+                    return
+            else:
+                server.count("files.create")
+            self._send_json(200, self._create(metadata))
+
+    def do_PUT(self):
+        server = self.server
+        body = self._read_body()
+        server.count("files.upload.resumable")
+        file_id = self.path.split("?")[0].rsplit("/", 1)[-1]
+        with server.lock:
+            entry = server.files.get(file_id, {"id": file_id})
+            entry["size"] = len(body)
+            server.contents[file_id] = body
+        self._send_json(200, entry)
+
+    def do_PATCH(self):
+        server = self.server
+        body = self._read_body()
+        time.sleep(server.latency)
+        server.count("files.update")
+        file_id = self.path.split("?")[0].rsplit("/", 1)[-1]
+        metadata, media = self._parts(body)
+        with server.lock:
+            entry = server.files.get(file_id)
+            if entry:
+                entry.update(metadata)
+                entry["size"] = len(body)
+                if media is not None:
+                    server.contents[file_id] = media
+        self._send_json(200, entry) if entry else self._send_json(404, {"error": {"code": 404, "message": "File not found"}})
+
+
+def start_drive_server(latency=0.05, error_rate=0.0, retry_after=0, seed=None):
+    """
+    Fake Drive v3 endpoint supporting about.get, files.list (name, contains, parents and trashed
+    clauses), files.get (metadata and alt=media), files.create (metadata, shortcuts,
+    multipart and resumable uploads) and files.update. Files live in `server.files`,
+    uploaded content in `server.contents`.
+    GET and POST requests fail with 429 or 503 (with Retry-After: `retry_after`) at
+    `error_rate`; statuses appended to `server.scripted_errors` are returned first.
+    Point the app at it with clients.API_ROOT_URLS["drive"] = server.base_url + "/".
+    """
+    server = _CountingServer(_DriveHandler)
+    server.latency = latency
+    server.files = {}
+    server.contents = {}
+    server.permission_id = "fake-permission-id"
+    server.error_rate = error_rate
+    server.retry_after = retry_after
+    server.random = random.Random(seed)
+    server.scripted_errors = deque()
+    return _start(server)
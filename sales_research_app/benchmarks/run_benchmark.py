@@ -0,0 +1,183 @@
+"""
+End-to-end benchmark of the research pipeline against local fakes.
+
+Runs the real gemini.research_company -> extractor.extract_content_from_urls ->
+gdrive.save_research_to_drive flow for a batch of companies, with a fake Gemini
+model, a local server for saved article pages and a fake Drive v3 endpoint.
+
+Usage (from the sales_research_app directory):
+    python -m benchmarks.run_benchmark --companies 20 --concurrency 4 --output results.json
+
+Prints a JSON report with per-stage latency percentiles, throughput, peak RSS,
+request counts per fake service and the scheduler's retry counts.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fakes
+
+STAGES = ("research", "extract", "upload", "total")
+
+
+def percentile(values, pct):
+    """Returns the pct-th percentile of values using linear interpolation."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values):
+    """Returns count, mean and p50/p90/p99/max in seconds for a list of durations."""
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def peak_rss_bytes():
+    """Returns the peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def compare(report, baseline):
+    """Returns per-stage p50/p90 and throughput ratios of report versus a baseline report (>1 means slower)."""
+    comparison = {}
+    for stage in STAGES:
+        for pct in ("p50", "p90"):
+            new = report["stages"].get(stage, {}).get(pct)
+            old = baseline.get("stages", {}).get(stage, {}).get(pct)
+            if new is not None and old:
+                comparison[f"{stage}.{pct}"] = new / old
+    if baseline.get("throughput_companies_per_second"):
+        comparison["throughput"] = report["throughput_companies_per_second"] / baseline["throughput_companies_per_second"]
+    return comparison
+
+
+def run(args):
+    article_server = fakes.start_article_server(slow_delay=args.slow_delay, huge_bytes=args.huge_bytes)
+    drive_server = fakes.start_drive_server(
+        latency=args.drive_latency, error_rate=args.drive_error_rate, seed=args.seed
+    )
+    model = fakes.FakeGeminiModel(
+        article_server.base_url,
+        responses=fakes.load_gemini_responses(args.responses.split(",") if args.responses else None),
+        latency=args.gemini_latency,
+        jitter=args.gemini_jitter,
+        failure_rate=args.gemini_failure_rate,
+        seed=args.seed
+    )
+
+    from google.oauth2.credentials import Credentials
+    from modules import clients, gemini, extractor, gdrive, scheduler
+
+    # Streamlit warns about the missing ScriptRunContext on every st.* call outside `streamlit run`
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    clients.API_ROOT_URLS["drive"] = drive_server.base_url + "/"
+    credentials = Credentials(token="benchmark-token")
+
+    timings = {stage: [] for stage in STAGES}
+    outcomes = {"companies": 0, "research_failed": 0, "articles_found": 0, "articles_extracted": 0, "drive_failed": 0}
+    lock = threading.Lock()
+
+    def research_one(index):
+        company_name = f"Benchmark Company {index}"
+        durations = {}
+        started = time.perf_counter()
+
+        t = time.perf_counter()
+        research_results = gemini.research_company(company_name, model=model)
+        durations["research"] = time.perf_counter() - t
+
+        urls = [a["url"] for a in research_results.get("articles", []) if a.get("url")]
+        t = time.perf_counter()
+        extracted_articles, _ = extractor.extract_content_from_urls(urls)
+        durations["extract"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        drive_link = gdrive.save_research_to_drive(credentials, company_name, research_results, extracted_articles)
+        durations["upload"] = time.perf_counter() - t
+        durations["total"] = time.perf_counter() - started
+
+        with lock:
+            for stage, duration in durations.items():
+                timings[stage].append(duration)
+            outcomes["companies"] += 1
+            outcomes["research_failed"] += len(research_results.get("errors", {})) >= 3
+            outcomes["articles_found"] += len(urls)
+            outcomes["articles_extracted"] += len(extracted_articles)
+            outcomes["drive_failed"] += not drive_link
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(research_one, range(args.companies)))
+    wall_time = time.perf_counter() - started
+
+    return {
+        "config": vars(args),
+        "wall_time_seconds": wall_time,
+        "throughput_companies_per_second": args.companies / wall_time if wall_time else None,
+        "stages": {stage: summarize(values) for stage, values in timings.items()},
+        "outcomes": outcomes,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "requests": {
+            "gemini": dict(model.calls),
+            "articles": dict(article_server.requests),
+            "drive": dict(drive_server.requests),
+        },
+        "scheduler": scheduler.get_scheduler().stats(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end research pipeline benchmark against local fakes.")
+    parser.add_argument("--companies", type=int, default=10, help="Number of companies to research.")
+    parser.add_argument("--concurrency", type=int, default=2, help="Companies researched at the same time.")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="Fake Gemini latency in seconds.")
+    parser.add_argument("--gemini-jitter", type=float, default=0.2, help="Random +/- variation of the Gemini latency.")
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0, help="Fraction of Gemini calls that fail.")
+    parser.add_argument("--responses", help="Comma-separated recorded responses to use (default: all in corpus/gemini).")
+    parser.add_argument("--slow-delay", type=float, default=2.0, help="Delay of /slow/ article pages in seconds.")
+    parser.add_argument("--huge-bytes", type=int, default=20 * 1024 * 1024, help="Size of /huge/ article pages.")
+    parser.add_argument("--drive-latency", type=float, default=0.05, help="Fake Drive latency per request in seconds.")
+    parser.add_argument("--drive-error-rate", type=float, default=0.0, help="Fraction of Drive requests answered with 429/503.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the fake Gemini.")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout.")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against (adds a 'comparison' section).")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f))
+    output = json.dumps(report, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Cold-start benchmark: module import times and Streamlit first paint.
+
+Every measurement runs in a fresh Python process, so nothing is already imported:
+- import times of the app's modules,
+- first paint of the sign-in page and of the signed-in research page (a full script
+  run through streamlit.testing.v1.AppTest, including imports), and a rerun of it,
+  plus whether the page loaded the OAuth libraries (the sign-in page should not),
+- the duration of each warm-up step (what warm_start.py takes off the first user's path).
+
+Usage (from the sales_research_app directory):
+    python -m benchmarks.startup_benchmark --repeats 5 --output startup.json
+    python -m benchmarks.startup_benchmark --baseline startup.json
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = (
+    "modules.auth", "modules.tracing", "modules.gemini", "modules.extractor",
+    "modules.cache", "modules.gdrive", "modules.jobs", "modules.batch",
+)
+
+# Streamlit itself is imported before timing starts: it is loaded before app.py runs
+IMPORT_SNIPPET = """
+import time, importlib, streamlit
+started = time.perf_counter()
+importlib.import_module({module!r})
+print(time.perf_counter() - started)
+"""
+
+FIRST_PAINT_SNIPPET = """
+import sys, time, logging
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+app = AppTest.from_file("app.py", default_timeout=120)
+if {signed_in!r}:
+    from google.oauth2.credentials import Credentials
+    app.session_state["credentials"] = Credentials(token="benchmark-token")
+    app.session_state["user_info"] = {{"email": "benchmark@example.com"}}
+app_loaded = time.perf_counter()
+app.run()
+first_paint = time.perf_counter()
+app.run()
+rerun = time.perf_counter()
+errors = [str(e.value) for e in app.exception]
+oauth_loaded = "google_auth_oauthlib" in sys.modules
+import json
+print(json.dumps({{"first_paint": first_paint - app_loaded, "rerun": rerun - first_paint, "errors": errors, "oauth_loaded": oauth_loaded}}))
+"""
+
+WARMUP_SNIPPET = """
+import json, logging
+logging.disable(logging.WARNING)
+from modules import warmup
+print(json.dumps(warmup.warm_up()))
+"""
+
+
+def _median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def _run(snippet, env):
+    """Runs a Python snippet in a fresh process in the app directory and returns its last stdout line."""
+    result = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=APP_DIR, env=env, capture_output=True, text=True, timeout=300
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "benchmark process failed")
+    return result.stdout.strip().splitlines()[-1]
+
+
+def run(args):
+    data_dir = tempfile.mkdtemp(prefix="startup-benchmark-")
+    env = dict(
+        os.environ,
+        WARMUP_ON_START="false",
+        GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", "benchmark-key"),
+        RESEARCH_CACHE_PATH=os.path.join(data_dir, "cache.sqlite3"),
+        ARTICLE_STORE_PATH=os.path.join(data_dir, "articles.sqlite3"),
+        STATE_BACKEND_URL="sqlite:///" + os.path.join(data_dir, "state.sqlite3"),
+        STATE_KEY_PATH=os.path.join(data_dir, "state.key"),
+    )
+
+    imports = {}
+    for module in MODULES:
+        try:
+            imports[module] = _median([float(_run(IMPORT_SNIPPET.format(module=module), env)) for _ in range(args.repeats)])
+        except RuntimeError as e:
+            imports[module] = {"error": str(e)}
+
+    pages = {}
+    for page, signed_in in (("sign_in", False), ("research", True)):
+        runs = [json.loads(_run(FIRST_PAINT_SNIPPET.format(signed_in=signed_in), env)) for _ in range(args.repeats)]
+        pages[page] = {
+            "first_paint": _median([r["first_paint"] for r in runs]),
+            "rerun": _median([r["rerun"] for r in runs]),
+            "errors": sorted({error for r in runs for error in r["errors"]}),
+            "oauth_loaded": any(r["oauth_loaded"] for r in runs),
+        }
+
+    try:
+        warm_up = json.loads(_run(WARMUP_SNIPPET, env))
+    except RuntimeError as e:
+        warm_up = {"error": str(e)}
+
+    return {"config": vars(args), "import_seconds": imports, "pages": pages, "warm_up_seconds": warm_up}
+
+
+def compare(report, baseline):
+    """Returns first paint and rerun ratios of report versus a baseline report (<1 means faster)."""
+    comparison = {}
+    for page, timings in report["pages"].items():
+        for name in ("first_paint", "rerun"):
+            old = baseline.get("pages", {}).get(page, {}).get(name)
+            if old:
+                comparison[f"{page}.{name}"] = timings[name] / old
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time and first paint benchmark.")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh processes per measurement (the median is reported).")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout.")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against (adds a 'comparison' section).")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f))
+    output = json.dumps(report, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+from modules.urls import normalize_url
+
+STORE_PATH = os.getenv("ARTICLE_STORE_PATH", os.path.join("data", "articles.sqlite3"))
+# Articles fetched within this window are served without contacting the site;
+# older ones are revalidated with a conditional GET
+FRESH_SECONDS = int(os.getenv("ARTICLE_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_BYTES = int(os.getenv("ARTICLE_STORE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+def content_hash(markdown_content):
+    """Returns the SHA-256 hex digest identifying a piece of extracted content."""
+    return hashlib.sha256(markdown_content.encode("utf-8")).hexdigest()
+
+
+class ArticleStore:
+    """
+    Content-addressed store for extracted articles, shared by every session in the process.
+    URLs (normalized) point at zlib-compressed markdown blobs keyed by content hash, so an
+    article found for several companies, or under several URLs, is stored once. The
+    ETag and Last-Modified of each URL are kept for conditional re-fetches. Once the
+    compressed blobs exceed `max_bytes`, the least recently used ones are evicted.
+    The store also remembers which blobs each user already has in Drive.
+    """
+
+    def __init__(self, path=STORE_PATH, max_bytes=MAX_BYTES, fresh_seconds=FRESH_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.counts = {"hits": 0, "revalidated": 0, "stored": 0}
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            " url_key TEXT PRIMARY KEY, url TEXT NOT NULL, content_hash TEXT NOT NULL,"
+            " etag TEXT, last_modified TEXT, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " content_hash TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS drive_files ("
+            " user_key TEXT NOT NULL, content_hash TEXT NOT NULL, file_id TEXT NOT NULL,"
+            " link TEXT, created_at REAL NOT NULL, PRIMARY KEY (user_key, content_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS articles_content_hash ON articles (content_hash)")
+        self._conn.commit()
+
+    def get(self, url):
+        """
+        Returns the stored article for a URL as a dict with 'url', 'markdown_content',
+        'content_hash', 'etag', 'last_modified' and 'fetched_at', or None.
+        """
+        key = normalize_url(url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT a.content_hash, a.etag, a.last_modified, a.fetched_at, b.data"
+                " FROM articles a JOIN blobs b ON b.content_hash = a.content_hash WHERE a.url_key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE articles SET accessed_at = ? WHERE url_key = ?", (time.time(), key))
+            self._conn.commit()
+        return {
+            "url": url,
+            "markdown_content": zlib.decompress(row["data"]).decode("utf-8"),
+            "content_hash": row["content_hash"],
+            "etag": row["etag"],
+            "last_modified": row["last_modified"],
+            "fetched_at": row["fetched_at"],
+        }
+
+    def is_fresh(self, article):
+        """Returns True if a stored article was fetched or revalidated recently enough to skip the request."""
+        return time.time() - article["fetched_at"] <= self.fresh_seconds
+
+    def record_hit(self):
+        with self._lock:
+            self.counts["hits"] += 1
+
+    def put(self, url, markdown_content, etag=None, last_modified=None):
+        """Stores freshly extracted content for a URL and returns its content hash."""
+        digest = content_hash(markdown_content)
+        now = time.time()
+        key = normalize_url(url)
+        with self._lock:
+            previous = self._conn.execute("SELECT content_hash FROM articles WHERE url_key = ?", (key,)).fetchone()
+            if not self._conn.execute("SELECT 1 FROM blobs WHERE content_hash = ?", (digest,)).fetchone():
+                data = zlib.compress(markdown_content.encode("utf-8"), 6)
+                self._conn.execute(
+                    "INSERT INTO blobs (content_hash, data, size) VALUES (?, ?, ?)", (digest, data, len(data))
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO articles (url_key, url, content_hash, etag, last_modified, fetched_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, digest, etag, last_modified, now, now)
+            )
+            if previous and previous["content_hash"] != digest:
+                # The page changed; drop its old content unless another URL still has it
+                self._conn.execute(
+                    "DELETE FROM blobs WHERE content_hash = ? AND NOT EXISTS"
+                    " (SELECT 1 FROM articles WHERE content_hash = ?)",
+                    (previous["content_hash"], previous["content_hash"])
+                )
+            self._evict()
+            self._conn.commit()
+            self.counts["stored"] += 1
+        return digest
+
+    def mark_revalidated(self, url):
+        """Records that the site answered 304 Not Modified, restarting the article's freshness window."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE articles SET fetched_at = ?, accessed_at = ? WHERE url_key = ?", (now, now, normalize_url(url))
+            )
+            self._conn.commit()
+            self.counts["revalidated"] += 1
+
+    def get_drive_file(self, user_key, digest):
+        """Returns (file_id, link) of a Drive file the user already has with this content, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id, link FROM drive_files WHERE user_key = ? AND content_hash = ?", (user_key, digest)
+            ).fetchone()
+        return (row["file_id"], row["link"]) if row else None
+
+    def set_drive_file(self, user_key, digest, file_id, link):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO drive_files (user_key, content_hash, file_id, link, created_at) VALUES (?, ?, ?, ?, ?)",
+                (user_key, digest, file_id, link, time.time())
+            )
+            self._conn.commit()
+
+    def forget_drive_file(self, user_key, digest):
+        """Drops a Drive file reference, e.g. after the file was deleted."""
+        with self._lock:
+            self._conn.execute("DELETE FROM drive_files WHERE user_key = ? AND content_hash = ?", (user_key, digest))
+            self._conn.commit()
+
+    def stats(self):
+        """Returns hit/revalidation/store counts plus the number of URLs, blobs and compressed bytes held."""
+        with self._lock:
+            urls = self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+            blobs, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            return dict(self.counts, urls=urls, blobs=blobs, bytes=size)
+
+    def _evict(self):
+        """Drops least recently used blobs (and the URLs pointing at them) until the store fits in max_bytes."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT b.content_hash, b.size FROM blobs b JOIN articles a ON a.content_hash = b.content_hash"
+            " GROUP BY b.content_hash ORDER BY MAX(a.accessed_at)"
+        ).fetchall()
+        for row in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM articles WHERE content_hash = ?", (row["content_hash"],))
+            self._conn.execute("DELETE FROM blobs WHERE content_hash = ?", (row["content_hash"],))
+            total -= row["size"]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process-wide article store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArticleStore()
+        return _store
@@ -1,21 +1,39 @@
 import os
+import json
+import time
+import uuid
+import hmac
+import base64
+import hashlib
+import secrets
+from urllib.parse import urlencode
 import streamlit as st
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
 import pickle
+from modules import tracing, state
+from modules.scopes import SCOPES
 
-# Scopes required for the application
-SCOPES = [
-    'https://www.googleapis.com/auth/drive.file',
-    'openid',
-    'https://www.googleapis.com/auth/userinfo.email',
-    'https://www.googleapis.com/auth/userinfo.profile'
-]
+# google_auth_oauthlib and google.auth are imported where they are used. The sign-in page
+# builds its authorization URL by hand, so it renders without loading them
 
-def get_google_auth_flow(redirect_uri):
-    """Initializes and returns the Google OAuth 2.0 flow."""
-    client_config = {
+# Sign-in sessions and pending OAuth requests live in the shared state backend (encrypted),
+# so any replica can serve a user and a restart doesn't sign everyone out
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL", str(30 * 24 * 3600)))
+OAUTH_STATE_TTL_SECONDS = 600
+# A sign-in page's URL is rebuilt once it is this old, which leaves the user at least five
+# minutes on Google's consent screen before the stored state expires
+OAUTH_URL_MAX_AGE_SECONDS = OAUTH_STATE_TTL_SECONDS - 300
+# The session ID is kept in a cookie rather than the URL, so it doesn't end up in browser
+# history, proxy logs or links people share
+SESSION_COOKIE = "sales_research_session"
+# Ties a pending sign-in to the browser that started it: the callback is only accepted
+# with the same nonce, so a stolen or forged ?code=...&state=... link can't sign a victim
+# into someone else's account (login CSRF). It lives for the browser session
+OAUTH_NONCE_COOKIE = "sales_research_oauth_nonce"
+
+@st.cache_resource
+def get_client_config(redirect_uri):
+    """Returns the OAuth client config for a redirect URI, built once per process."""
+    return {
         "web": {
             "client_id": os.getenv("GOOGLE_CLIENT_ID"),
             "project_id": "sales-research-app", # Placeholder, not strictly used by flow but good practice
@@ -26,45 +44,151 @@ def get_google_auth_flow(redirect_uri):
             "redirect_uris": [redirect_uri]
         }
     }
+
+def get_google_auth_flow(redirect_uri, code_verifier=None):
+    """Initializes and returns the Google OAuth 2.0 flow."""
+    from google_auth_oauthlib.flow import Flow
     flow = Flow.from_client_config(
-        client_config,
+        get_client_config(redirect_uri),
         scopes=SCOPES,
-        redirect_uri=redirect_uri
+        redirect_uri=redirect_uri,
+        code_verifier=code_verifier
     )
     return flow
 
 def build_authorization_url(redirect_uri):
-    """Builds the Google authorization URL."""
-    flow = get_google_auth_flow(redirect_uri)
-    authorization_url, state = flow.authorization_url(
-        access_type='offline',
-        include_granted_scopes='true'
+    """
+    Builds the Google authorization URL (authorization code flow with PKCE, the same
+    request Flow.authorization_url makes) without importing the OAuth libraries. The URL
+    is kept in session state, so reruns of the sign-in page reuse it until it gets close
+    to the expiry of its stored state. Also sets the browser's sign-in nonce cookie, which
+    the pending state is bound to (see fetch_tokens).
+    """
+    nonce = st.session_state.get('oauth_nonce') or get_cookie(OAUTH_NONCE_COOKIE) or secrets.token_urlsafe(32)
+    st.session_state['oauth_nonce'] = nonce
+    _set_cookie(f"{OAUTH_NONCE_COOKIE}={nonce}; Path=/; SameSite=Lax")
+    if (st.session_state.get('oauth_url_redirect_uri') == redirect_uri and st.session_state.get('oauth_url')
+            and time.time() - st.session_state.get('oauth_url_created_at', 0) < OAUTH_URL_MAX_AGE_SECONDS):
+        return st.session_state['oauth_url']
+    client_config = get_client_config(redirect_uri)["web"]
+    oauth_state = secrets.token_urlsafe(24)
+    code_verifier = secrets.token_urlsafe(96) # 128 characters, the maximum RFC 7636 allows
+    code_challenge = base64.urlsafe_b64encode(hashlib.sha256(code_verifier.encode()).digest()).rstrip(b"=").decode()
+    authorization_url = client_config["auth_uri"] + "?" + urlencode({
+        "response_type": "code",
+        "client_id": client_config["client_id"],
+        "redirect_uri": redirect_uri,
+        "scope": " ".join(SCOPES),
+        "state": oauth_state,
+        "code_challenge": code_challenge,
+        "code_challenge_method": "S256",
+        "access_type": "offline",
+        "include_granted_scopes": "true",
+    })
+    # The callback may reach another replica, so the verifier is stored under the state value
+    state.get_secrets().set(
+        f"oauth:{oauth_state}",
+        {"redirect_uri": redirect_uri, "code_verifier": code_verifier, "nonce": nonce},
+        ttl=OAUTH_STATE_TTL_SECONDS
     )
-    st.session_state['oauth_state'] = state
+    st.session_state['oauth_state'] = oauth_state
+    st.session_state['oauth_url'] = authorization_url
+    st.session_state['oauth_url_redirect_uri'] = redirect_uri
+    st.session_state['oauth_url_created_at'] = time.time()
     return authorization_url
 
-def fetch_tokens(authorization_response):
-    """Fetches tokens from the authorization response."""
-    flow = get_google_auth_flow(st.session_state.get('redirect_uri'))
-    flow.fetch_token(authorization_response=authorization_response)
+def fetch_tokens(authorization_code, oauth_state, nonce):
+    """
+    Exchanges the authorization code from the OAuth callback for credentials and starts
+    a stored session. `nonce` is the callback browser's OAUTH_NONCE_COOKIE. Returns the
+    credentials, or None if the state is unknown or expired (each state can be used once)
+    or was started in another browser.
+    """
+    pending = state.get_secrets().pop(f"oauth:{oauth_state}")
+    if not pending or not nonce or not hmac.compare_digest(pending.get('nonce', ''), nonce):
+        return None
+    flow = get_google_auth_flow(pending['redirect_uri'], code_verifier=pending['code_verifier'])
+    flow.fetch_token(code=authorization_code)
     st.session_state['credentials'] = flow.credentials
+    st.session_state['session_id'] = uuid.uuid4().hex
+    save_session()
     return flow.credentials
 
+def _credentials_from_info(info):
+    from google.oauth2.credentials import Credentials
+    # to_json() leaves out empty fields that from_authorized_user_info insists on
+    return Credentials.from_authorized_user_info(
+        dict({"refresh_token": None, "client_id": None, "client_secret": None}, **info)
+    )
+
+def save_session():
+    """Stores the current credentials and user info (encrypted) under the session ID."""
+    session_id = st.session_state.get('session_id')
+    creds = st.session_state.get('credentials')
+    if not session_id or not creds:
+        return
+    state.get_secrets().set(
+        f"session:{session_id}",
+        {"credentials": json.loads(creds.to_json()), "user_info": st.session_state.get('user_info')},
+        ttl=SESSION_TTL_SECONDS
+    )
+
+def restore_session(session_id):
+    """Loads a stored session into session state. Returns True if the session exists."""
+    record = state.get_secrets().get(f"session:{session_id}")
+    if not record:
+        return False
+    st.session_state['credentials'] = _credentials_from_info(record['credentials'])
+    st.session_state['user_info'] = record.get('user_info')
+    st.session_state['session_id'] = session_id
+    return True
+
 def get_credentials():
-    """Retrieves credentials from session state."""
+    """
+    Retrieves credentials from session state, refreshing them if they expired.
+    With a stored session, the refresh holds a lock shared by all replicas; a replica that
+    waited for the lock picks up the token the other one stored instead of refreshing again.
+    If the lock can't be taken in time, the stored token is used when it is valid, and the
+    credentials are refreshed without the lock otherwise.
+    """
     if 'credentials' in st.session_state:
         creds = st.session_state['credentials']
         if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-            st.session_state['credentials'] = creds # Update session state with refreshed creds
+            session_id = st.session_state.get('session_id')
+            if session_id:
+                try:
+                    with state.get_backend().lock(f"token_refresh:{session_id}", ttl=30, timeout=30):
+                        creds = _stored_or_refreshed(session_id, creds)
+                except state.LockTimeout:
+                    # The holder may have died mid-refresh; don't leave the user without a token
+                    creds = _stored_or_refreshed(session_id, creds)
+                st.session_state['credentials'] = creds
+                save_session()
+            else:
+                _refresh(creds)
+                st.session_state['credentials'] = creds # Update session state with refreshed creds
         return creds
     return None
 
+def _stored_or_refreshed(session_id, creds):
+    """Returns the session's stored credentials if another replica already refreshed them, else refreshes creds."""
+    record = state.get_secrets().get(f"session:{session_id}")
+    stored = _credentials_from_info(record['credentials']) if record else None
+    if stored and stored.valid:
+        return stored
+    _refresh(creds)
+    return creds
+
+def _refresh(creds):
+    from google.auth.transport.requests import Request
+    with tracing.span("auth.token_refresh"):
+        creds.refresh(Request())
+
 def get_user_info(credentials):
     """Fetches user information (email, name) using the credentials."""
-    from googleapiclient.discovery import build
+    from modules import clients
     try:
-        service = build('oauth2', 'v2', credentials=credentials)
+        service = clients.get_service('oauth2', 'v2', credentials)
         user_info = service.userinfo().get().execute()
         return user_info
     except Exception as e:
@@ -75,13 +199,49 @@ def is_authenticated():
     """Checks if the user is authenticated."""
     return 'credentials' in st.session_state and st.session_state['credentials'] is not None
 
+def get_cookie(name):
+    """Returns a cookie the browser sent when the page loaded, or None."""
+    value = st.context.cookies.get(name)
+    return value if isinstance(value, str) else None # Outside a server (e.g. AppTest) there are no cookies
+
+def _set_cookie(cookie):
+    """
+    Sets a cookie ("name=value; attributes") in the browser. Streamlit can only read cookies,
+    so it is written by a small script on the page; Secure is added over https.
+    """
+    st.html(
+        f"<script>document.cookie = {json.dumps(cookie)} + (location.protocol === 'https:' ? '; Secure' : '');</script>",
+        unsafe_allow_javascript=True
+    )
+
+def sync_session_cookie():
+    """
+    Keeps the browser's session cookie in step with the signed-in session: sets it after a
+    sign-in and expires it after a sign-out. Cookies are read as sent when the page loaded,
+    so what was written since is tracked in session state.
+    """
+    wanted = st.session_state.get('session_id') if is_authenticated() else None
+    current = st.session_state.get('session_cookie', get_cookie(SESSION_COOKIE))
+    if wanted == current:
+        return
+    if wanted:
+        _set_cookie(f"{SESSION_COOKIE}={wanted}; Max-Age={SESSION_TTL_SECONDS}; Path=/; SameSite=Lax")
+    else:
+        _set_cookie(f"{SESSION_COOKIE}=; Max-Age=0; Path=/; SameSite=Lax")
+    st.session_state['session_cookie'] = wanted
+
 def sign_out():
-    """Clears authentication credentials from session state."""
+    """Clears authentication credentials from session state and deletes the stored session."""
+    if st.session_state.get('session_id'):
+        state.get_backend().delete(f"session:{st.session_state['session_id']}")
+    if 'session_id' in st.session_state:
+        del st.session_state['session_id']
     if 'credentials' in st.session_state:
         del st.session_state['credentials']
     if 'user_info' in st.session_state:
         del st.session_state['user_info']
-    if 'oauth_state' in st.session_state:
-        del st.session_state['oauth_state']
+    for key in ('oauth_state', 'oauth_url', 'oauth_url_redirect_uri', 'oauth_url_created_at', 'oauth_nonce'):
+        if key in st.session_state:
+            del st.session_state[key]
     if 'redirect_uri' in st.session_state:
         del st.session_state['redirect_uri']
\ No newline at end of file
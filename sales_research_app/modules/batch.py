@@ -0,0 +1,271 @@
+import os
+import io
+import csv
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+
+from modules import cache, gdrive
+
+RESEARCH_WORKERS = int(os.getenv("BATCH_RESEARCH_WORKERS", "2"))
+EXTRACT_WORKERS = int(os.getenv("BATCH_EXTRACT_WORKERS", "2"))
+UPLOAD_WORKERS = int(os.getenv("BATCH_UPLOAD_WORKERS", "2"))
+QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "4"))
+CHECKPOINT_DIR = os.getenv("BATCH_CHECKPOINT_DIR", os.path.join("data", "batches"))
+
+logger = logging.getLogger(__name__)
+
+_COMPANY_COLUMNS = ("company", "company_name", "company name", "account", "account name", "name")
+_STOP = object()
+
+
+def read_companies_csv(csv_file):
+    """
+    Reads company names from a CSV file object (text or bytes).
+    Uses a 'company'/'company_name'/'account' style header column when present,
+    otherwise the first column. Blank and duplicate names are dropped.
+    """
+    content = csv_file.read()
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+    rows = list(csv.reader(io.StringIO(content)))
+    if not rows:
+        return []
+
+    header = [cell.strip().casefold() for cell in rows[0]]
+    column = 0
+    for name in _COMPANY_COLUMNS:
+        if name in header:
+            column = header.index(name)
+            rows = rows[1:]
+            break
+
+    companies = []
+    seen = set()
+    for row in rows:
+        if len(row) <= column or not row[column].strip():
+            continue
+        key = cache.normalize_company_name(row[column])
+        if key not in seen:
+            seen.add(key)
+            companies.append(row[column].strip())
+    return companies
+
+
+def default_checkpoint_path(companies, incremental=False):
+    """
+    Returns a checkpoint path derived from the company list, so re-running the same list resumes it.
+    Incremental refreshes get a checkpoint per day, so next week's refresh of a watchlist starts over.
+    """
+    digest = hashlib.sha256("\n".join(cache.normalize_company_name(c) for c in companies).encode()).hexdigest()[:16]
+    if incremental:
+        return os.path.join(CHECKPOINT_DIR, f"batch_{digest}_refresh_{time.strftime('%Y%m%d')}.json")
+    return os.path.join(CHECKPOINT_DIR, f"batch_{digest}.json")
+
+
+def load_checkpoint(path):
+    """Loads per-company batch state from a checkpoint file ({} if it does not exist)."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+class _Checkpoint:
+    """Thread-safe per-company state persisted to a JSON file after every update."""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = load_checkpoint(path)
+        self._lock = threading.Lock()
+
+    def is_done(self, company_name):
+        return self.state.get(cache.normalize_company_name(company_name), {}).get("status") == "done"
+
+    def update(self, company_name, **fields):
+        with self._lock:
+            entry = self.state.setdefault(cache.normalize_company_name(company_name), {"company": company_name})
+            entry.update(fields, updated_at=time.time())
+            if not self.path:
+                return
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_path, self.path) # Atomic, so an interrupted write never corrupts the checkpoint
+
+
+def _research(item, report, force_refresh, credentials=None, incremental=False):
+    if incremental and "previous" not in item:
+        # None when the company has no earlier folder with a manifest: it gets a full save
+        item["previous"] = gdrive.find_previous_research(credentials, item["company"], report=report)
+    results = cache.cached_research_company(item["company"], force_refresh=force_refresh, report=report)
+    if len(results.get("errors", {})) >= 3:
+        raise RuntimeError("Gemini research failed: " + "; ".join(results["errors"].values()))
+    item["research_results"] = results
+    return item
+
+
+def _extract(item, report, force_refresh):
+    if item.get("previous"):
+        urls = gdrive.new_article_urls(item["previous"]["manifest"], item["research_results"])
+    else:
+        urls = [a["url"] for a in item["research_results"].get("articles", []) if a.get("url")]
+    item["extracted_articles"], messages = cache.cached_extract_content_from_urls(urls, force_refresh=force_refresh) if urls else ([], [])
+    for level, message in messages:
+        report(message, level=level)
+    return item
+
+
+def _upload(item, report, credentials):
+    if item.get("previous"):
+        changes = gdrive.refresh_research_in_drive(
+            credentials, item["previous"], item["company"], item["research_results"], item["extracted_articles"],
+            report=report
+        )
+        if not changes:
+            raise RuntimeError("Failed to update Google Drive.")
+        item["drive_link"] = changes["drive_link"]
+        return item
+    drive_link = gdrive.save_research_to_drive(
+        credentials, item["company"], item["research_results"], item["extracted_articles"], report=report
+    )
+    if not drive_link:
+        raise RuntimeError("Failed to save to Google Drive.")
+    item["drive_link"] = drive_link
+    return item
+
+
+def run_batch(companies, credentials, checkpoint_path=None, force_refresh=False, incremental=False,
+              research_workers=RESEARCH_WORKERS, extract_workers=EXTRACT_WORKERS,
+              upload_workers=UPLOAD_WORKERS, queue_size=QUEUE_SIZE,
+              progress_callback=None, stop_event=None):
+    """
+    Runs companies through a research -> extraction -> Drive upload pipeline.
+
+    Each stage has its own worker threads and the stages are connected by bounded
+    queues, so a slow stage blocks the one feeding it instead of buffering results.
+    Transient Gemini, article and Drive failures are retried by the shared scheduler
+    inside each call, so a stage that still fails marks the company as failed.
+    Per-company state is written to `checkpoint_path`, and companies already marked
+    done there are skipped, which resumes an interrupted batch. With `incremental`, companies that
+    already have a research folder in Drive are refreshed in place (only new articles
+    are fetched and uploaded) instead of getting a new folder.
+
+    progress_callback(company, stage, status, detail) is called from worker threads
+    for every stage transition, and with status "warning" or "error" for problems
+    reported inside a stage (e.g. an article that could not be fetched). Setting `stop_event` stops feeding new companies.
+    Returns the checkpoint state: a dict of normalized company name -> entry.
+    """
+    checkpoint = _Checkpoint(checkpoint_path)
+    stop_event = stop_event or threading.Event()
+
+    def report(company, stage, status, detail=None):
+        # Progress is informational: a failing callback (e.g. a locked job store) must not stop a worker
+        if progress_callback:
+            try:
+                progress_callback(company, stage, status, detail)
+            except Exception as e:
+                logger.warning("Batch progress callback failed for %s: %s", company, e)
+
+    def update_checkpoint(company, **fields):
+        try:
+            checkpoint.update(company, **fields)
+        except Exception as e:
+            logger.warning("Could not write batch checkpoint for %s: %s", company, e)
+
+    stages = [
+        ("research", lambda item, messages: _research(item, messages, force_refresh, credentials, incremental), research_workers),
+        ("extract", lambda item, messages: _extract(item, messages, force_refresh), extract_workers),
+        ("upload", lambda item, messages: _upload(item, messages, credentials), upload_workers),
+    ]
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+
+    def stage_worker(name, fn, in_queue, out_queue):
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                return
+            company = item["company"]
+            report(company, name, "started")
+            update_checkpoint(company, status="running", stage=name)
+
+            def messages(message, level="info", company=company, name=name):
+                # Per-file and per-article successes would flood the log; problems are passed on
+                if level in ("warning", "error"):
+                    report(company, name, level, message)
+
+            try:
+                item = fn(item, messages)
+            except Exception as e:
+                update_checkpoint(company, status="failed", stage=name, error=str(e))
+                report(company, name, "failed", str(e))
+                continue
+            report(company, name, "done")
+            out_queue.put(item)
+
+    def collector():
+        while True:
+            item = queues[-1].get()
+            if item is _STOP:
+                return
+            update_checkpoint(item["company"], status="done", stage="upload", drive_link=item["drive_link"], error=None)
+            report(item["company"], "batch", "done", item["drive_link"])
+
+    stage_threads = []
+    for index, (name, fn, workers) in enumerate(stages):
+        threads = [
+            threading.Thread(target=stage_worker, args=(name, fn, queues[index], queues[index + 1]),
+                             name=f"batch-{name}-{n}", daemon=True)
+            for n in range(max(1, workers))
+        ]
+        for thread in threads:
+            thread.start()
+        stage_threads.append(threads)
+    collector_thread = threading.Thread(target=collector, name="batch-collector", daemon=True)
+    collector_thread.start()
+
+    for company in companies:
+        if stop_event.is_set():
+            break
+        if checkpoint.is_done(company):
+            report(company, "batch", "skipped", "Already completed in checkpoint.")
+            continue
+        queues[0].put({"company": company}) # Blocks while the research stage is saturated
+
+    # Shut the stages down in order so every queued item drains first
+    for index, threads in enumerate(stage_threads):
+        for _ in threads:
+            queues[index].put(_STOP)
+        for thread in threads:
+            thread.join()
+    queues[-1].put(_STOP)
+    collector_thread.join()
+    return checkpoint.state
+
+
+def batch_job(job, companies, credentials=None, force_refresh=False, incremental=False):
+    """
+    Job queue entry point for a batch: runs run_batch with progress reported as job
+    events and cancellation wired to the job. Returns per-company outcomes.
+    """
+    def on_progress(company, stage, status, detail):
+        level = "error" if status in ("failed", "error") else "warning" if status == "warning" else "success" if stage == "batch" else "info"
+        job.progress(f"[{stage}] {company}: {status}" + (f" ({detail})" if detail else ""), level=level)
+
+    state = run_batch(
+        companies, credentials,
+        checkpoint_path=default_checkpoint_path(companies, incremental),
+        force_refresh=force_refresh,
+        incremental=incremental,
+        progress_callback=on_progress,
+        stop_event=job.cancel_event
+    )
+    return {"companies": [
+        {key: entry.get(key) for key in ("company", "status", "stage", "drive_link", "error")}
+        for entry in state.values()
+    ]}
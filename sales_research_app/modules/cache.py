@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+
+from modules import gemini, extractor, article_store
+
+CACHE_PATH = os.getenv("RESEARCH_CACHE_PATH", os.path.join("data", "research_cache.sqlite3"))
+RESEARCH_TTL_SECONDS = int(os.getenv("RESEARCH_CACHE_TTL", str(24 * 3600)))
+MAX_ENTRIES = int(os.getenv("RESEARCH_CACHE_MAX_ENTRIES", "5000"))
+
+RESEARCH_NAMESPACE = "research"
+
+
+def normalize_company_name(company_name):
+    """Normalizes a company name for use as a cache key ("  ACME, Inc. " -> "acme, inc")."""
+    name = re.sub(r"\s+", " ", (company_name or "").strip().casefold())
+    return name.rstrip(".")
+
+
+class ResearchCache:
+    """
+    SQLite-backed cache shared by every Streamlit session in the process.
+    Entries expire after a per-namespace TTL and the least recently used
+    entries are evicted once the cache holds more than `max_entries`.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, ttls=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = ttls or {RESEARCH_NAMESPACE: RESEARCH_TTL_SECONDS}
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self._conn.commit()
+
+    def get(self, namespace, key):
+        """Returns the cached value, or None if it is missing or older than the namespace TTL."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row and now - row[1] <= self.ttls.get(namespace, RESEARCH_TTL_SECONDS):
+                self._conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key)
+                )
+                self._conn.commit()
+                self.hits[namespace] = self.hits.get(namespace, 0) + 1
+                return json.loads(row[0])
+            if row:
+                self._conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+                self._conn.commit()
+            self.misses[namespace] = self.misses.get(namespace, 0) + 1
+            return None
+
+    def set(self, namespace, key, value):
+        """Stores a JSON-serializable value and evicts least recently used entries over the limit."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM entries WHERE rowid IN ("
+                " SELECT rowid FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """Returns hit and miss counts per namespace plus the number of stored entries."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return {"hits": dict(self.hits), "misses": dict(self.misses), "entries": entries}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Returns the process-wide research cache, opening it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResearchCache()
+        return _cache
+
+
+def get_cached_research(company_name):
+    """Returns cached research results for a company, or None."""
+    return get_cache().get(RESEARCH_NAMESPACE, normalize_company_name(company_name))
+
+
+def store_research(company_name, results):
+    """Caches research results unless any prompt failed (partial results are not cached)."""
+    if not results.get("errors"):
+        get_cache().set(RESEARCH_NAMESPACE, normalize_company_name(company_name), results)
+
+
+def cached_research_company(company_name, force_refresh=False, report=None):
+    """
+    Returns gemini.research_company results, served from the cache when available.
+    Partial results (any failed prompt) are returned but not cached. `report` receives
+    Gemini's status messages (see gemini.research_company).
+    """
+    if not force_refresh:
+        cached = get_cached_research(company_name)
+        if cached is not None:
+            return cached
+
+    results = gemini.research_company(company_name, report=report)
+    store_research(company_name, results)
+    return results
+
+
+def iter_cached_extracted_articles(urls, force_refresh=False):
+    """
+    Yields (article or None, status_messages) per URL: articles from the article store
+    first, then the rest as extractor.iter_extracted_articles finishes them (storing each
+    one). Stored articles past their freshness window, or all of them with force_refresh,
+    are re-fetched with a conditional GET and reused as-is when the site answers 304.
+    Articles carry a 'content_hash' for deduplicating Drive uploads.
+    """
+    store = article_store.get_store()
+    stored_articles = {}
+    validators = {}
+    missing_urls = []
+    for url in urls:
+        stored = store.get(url)
+        if stored is not None and not force_refresh and store.is_fresh(stored):
+            store.record_hit()
+            yield _stored_article(stored), [("info", f"Using cached content for: {url}")]
+            continue
+        if stored is not None:
+            stored_articles[url] = stored
+            validators[url] = {"etag": stored["etag"], "last_modified": stored["last_modified"]}
+        missing_urls.append(url)
+
+    for article, messages in extractor.iter_extracted_articles(missing_urls, validators=validators):
+        if article and article.get("not_modified"):
+            store.mark_revalidated(article["url"])
+            article = _stored_article(stored_articles[article["url"]])
+        elif article:
+            article["content_hash"] = store.put(
+                article["url"], article["markdown_content"], article.get("etag"), article.get("last_modified")
+            )
+        yield article, messages
+
+
+def _stored_article(stored):
+    return {"url": stored["url"], "markdown_content": stored["markdown_content"], "content_hash": stored["content_hash"]}
+
+
+def cached_extract_content_from_urls(urls, force_refresh=False):
+    """
+    Cached equivalent of extractor.extract_content_from_urls: only URLs missing from the cache are extracted.
+    Returns (articles, status_messages) in input order, like the wrapped function.
+    """
+    articles_by_url = {}
+    status_messages = []
+    for article, messages in iter_cached_extracted_articles(urls, force_refresh=force_refresh):
+        status_messages.extend(messages)
+        if article:
+            articles_by_url[article["url"]] = article
+
+    return [articles_by_url[url] for url in urls if url in articles_by_url], status_messages
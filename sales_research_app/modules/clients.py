@@ -0,0 +1,124 @@
+"""
+Shared API clients and HTTP sessions.
+
+Thread-safety rules:
+* Discovery documents are parsed once per process and are immutable afterwards.
+* Google API service objects are cached per thread, per credentials. Their
+  httplib2 transport keeps connections alive but is not thread-safe, so a
+  service returned by get_service must only be used on the thread that got it.
+  Long-lived worker pools therefore reuse their connections across calls.
+* The article HTTP session is shared by all threads. urllib3's connection pool
+  is thread-safe; callers must not change the session's headers, adapters or
+  cookies after creation.
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
+
+# Optional directory of "<api>.<version>.json" discovery documents overriding the bundled ones
+DISCOVERY_DOCS_DIR = os.getenv("DISCOVERY_DOCS_DIR")
+# Optional root URL overrides, e.g. DRIVE_API_ROOT_URL="http://localhost:9000/" for a local fake
+API_ROOT_URLS = {
+    "drive": os.getenv("DRIVE_API_ROOT_URL"),
+    "oauth2": os.getenv("OAUTH2_API_ROOT_URL"),
+}
+GOOGLE_API_TIMEOUT_SECONDS = int(os.getenv("GOOGLE_API_TIMEOUT", "60"))
+MAX_SERVICES_PER_THREAD = int(os.getenv("MAX_SERVICES_PER_THREAD", "16"))
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "32"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "8"))
+HTTP_USER_AGENT = os.getenv(
+    "HTTP_USER_AGENT",
+    "Mozilla/5.0 (compatible; SalesResearchAssistant/1.0; +https://github.com/bmeyer99/sales_research)"
+)
+
+_discovery_docs = {}
+_discovery_docs_lock = threading.Lock()
+
+_thread_local = threading.local()
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def credentials_key(credentials):
+    """Returns a stable per-user key for credentials without keeping the secret itself."""
+    identity = f"{getattr(credentials, 'client_id', '')}:{getattr(credentials, 'refresh_token', None) or getattr(credentials, 'token', '')}"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def get_discovery_document(api, version):
+    """
+    Returns the parsed discovery document for an API, loaded from static files
+    (DISCOVERY_DOCS_DIR if set, otherwise the copies bundled with googleapiclient).
+    """
+    key = (api, version)
+    with _discovery_docs_lock:
+        document = _discovery_docs.get(key)
+        if document is None:
+            content = None
+            if DISCOVERY_DOCS_DIR:
+                path = os.path.join(DISCOVERY_DOCS_DIR, f"{api}.{version}.json")
+                if os.path.exists(path):
+                    with open(path) as f:
+                        content = f.read()
+            content = content or discovery_cache.get_static_doc(api, version)
+            if content is None:
+                raise ValueError(f"No static discovery document for {api} {version}")
+            document = json.loads(content)
+            root_url = API_ROOT_URLS.get(api)
+            if root_url:
+                document["rootUrl"] = document["mtlsRootUrl"] = root_url
+            _discovery_docs[key] = document
+        return document
+
+
+def get_service(api, version, credentials):
+    """
+    Returns a Google API service object for the credentials, cached for the calling thread.
+    The service keeps its authorized HTTP connection open between calls.
+    """
+    services = getattr(_thread_local, "services", None)
+    if services is None:
+        services = _thread_local.services = OrderedDict()
+
+    key = (api, version, credentials_key(credentials))
+    cached = services.get(key)
+    # A new credentials object for the same user (e.g. after sign-in) gets a new service
+    if cached is not None and cached[1] is credentials:
+        services.move_to_end(key)
+        return cached[0]
+
+    http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=GOOGLE_API_TIMEOUT_SECONDS))
+    service = build_from_document(get_discovery_document(api, version), http=http)
+    services[key] = (service, credentials)
+    while len(services) > MAX_SERVICES_PER_THREAD:
+        services.popitem(last=False)
+    return service
+
+
+def get_http_session():
+    """Returns the process-wide keep-alive HTTP session used for article fetching."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({
+                "User-Agent": HTTP_USER_AGENT,
+                "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.5",
+                "Accept-Encoding": "gzip, deflate",
+            })
+            _http_session = session
+        return _http_session
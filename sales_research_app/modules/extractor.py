@@ -1,33 +1,311 @@
-import trafilatura
-import streamlit as st
+import os
+import re
+import time
+import codecs
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse, urljoin
+
 import requests
 
-def extract_content_from_urls(urls):
+from modules import clients, tracing, scheduler
+
+# Concurrency and timeout settings, overridable through the environment
+MAX_CONCURRENT_FETCHES = int(os.getenv("EXTRACTOR_MAX_CONCURRENCY", "8"))
+MAX_FETCHES_PER_HOST = int(os.getenv("EXTRACTOR_MAX_PER_HOST", "2"))
+FETCH_TIMEOUT_SECONDS = int(os.getenv("EXTRACTOR_FETCH_TIMEOUT", "15"))
+PARSE_TIMEOUT_SECONDS = int(os.getenv("EXTRACTOR_PARSE_TIMEOUT", "30"))
+PARSE_WORKERS = int(os.getenv("EXTRACTOR_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Download limits: at most MAX_DOWNLOAD_BYTES of a page body is ever held in memory
+MAX_DOWNLOAD_BYTES = int(os.getenv("EXTRACTOR_MAX_BYTES", str(5 * 1024 * 1024)))
+MAX_REDIRECTS = int(os.getenv("EXTRACTOR_MAX_REDIRECTS", "5"))
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+# Content types passed on to trafilatura; a missing Content-Type is treated as HTML
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+_META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_host_semaphore(url):
+    """Returns the semaphore limiting concurrent fetches against the URL's host."""
+    host = urlparse(url).netloc.lower()
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(MAX_FETCHES_PER_HOST)
+            _host_semaphores[host] = semaphore
+        return semaphore
+
+
+def _get_parse_pool():
+    """
+    Returns the process-wide pool used for trafilatura parsing.
+    'spawn' is used because forking the multi-threaded Streamlit server is unsafe.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_pool
+
+
+def warm_parse_pool():
+    """Starts every parse worker and has it import trafilatura, so the first real parse doesn't pay for it."""
+    pool = _get_parse_pool()
+    futures = [pool.submit(_parse_html, "<html><body><p>warm up</p></body></html>") for _ in range(PARSE_WORKERS)]
+    for future in futures:
+        future.result(timeout=PARSE_TIMEOUT_SECONDS)
+
+
+def _reset_parse_pool():
+    """Drops a broken parse pool so the next call creates a fresh one."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False)
+        _parse_pool = None
+
+
+class FetchRejected(Exception):
+    """Raised when a URL is not downloaded; `reason` is shown to the user and `outcome` labels the span."""
+
+    def __init__(self, reason, outcome):
+        super().__init__(reason)
+        self.reason = reason
+        self.outcome = outcome
+
+
+class NotModified(Exception):
+    """Raised when a conditional GET is answered with 304: the stored copy is still current."""
+
+
+def _open(url, headers=None):
+    """
+    Requests a URL over the shared keep-alive session without reading the body, following
+    at most MAX_REDIRECTS redirects by hand. Returns the streaming final response (200 or 304).
+    Raises scheduler.TransientError for statuses worth retrying (429, 5xx), and FetchRejected
+    for other error statuses and redirect loops or chains that are too long.
+    """
+    session = clients.get_http_session()
+    for _ in range(MAX_REDIRECTS + 1):
+        response = session.get(url, headers=headers, timeout=FETCH_TIMEOUT_SECONDS, stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            if response.status_code in scheduler.RETRYABLE_STATUSES:
+                response.close()
+                raise scheduler.TransientError(
+                    f"server returned HTTP {response.status_code}",
+                    scheduler.parse_retry_after(response.headers.get("Retry-After"))
+                )
+            if response.status_code not in (200, 304):
+                response.close()
+                raise FetchRejected(f"server returned HTTP {response.status_code}", f"http_{response.status_code}")
+            return response
+        location = response.headers.get("Location")
+        response.close()
+        url = urljoin(url, location)
+        if urlparse(url).scheme not in ("http", "https"):
+            raise FetchRejected(f"redirected to an unsupported URL ({url})", "redirect")
+    raise FetchRejected(f"more than {MAX_REDIRECTS} redirects", "redirect")
+
+
+def _response_charset(response, first_chunk):
+    """Returns the charset from the Content-Type header, else from a <meta> tag near the top of the page, else UTF-8."""
+    candidates = []
+    for param in response.headers.get("Content-Type", "").split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "charset" and value:
+            candidates.append(value.strip("\"' "))
+    match = _META_CHARSET_PATTERN.search(first_chunk[:4096])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for candidate in candidates:
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+def _fetch(url, validators=None):
+    """
+    Downloads an HTML page in chunks, checking status and Content-Type before reading the body.
+    At most MAX_DOWNLOAD_BYTES are read (longer pages are truncated) and the body is decoded
+    incrementally. `validators` ({'etag', 'last_modified'} from an earlier fetch) make the
+    request conditional. Returns a tuple of (html text, truncated, validators of this response).
+    Raises FetchRejected when the page is skipped and NotModified on a 304.
+    """
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    # The host is an attribute (JSON trace only), not a label: every article host would be a new series
+    with tracing.span("extractor.fetch", host=urlparse(url).netloc.lower()) as span:
+        try:
+            response = _open(url, headers=headers or None)
+        except FetchRejected as e:
+            span.set_outcome(e.outcome)
+            raise
+        except scheduler.TransientError:
+            span.set_outcome("transient")
+            raise
+
+        with response:
+            if response.status_code == 304:
+                span.set_outcome("not_modified")
+                raise NotModified()
+            response_validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type and content_type not in HTML_CONTENT_TYPES:
+                span.set_outcome("content_type")
+                raise FetchRejected(f"not an HTML page ({content_type})", "content_type")
+
+            deadline = time.monotonic() + FETCH_TIMEOUT_SECONDS
+            decoder = None
+            parts = []
+            received = 0
+            truncated = False
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder(_response_charset(response, chunk))(errors="replace")
+                chunk = chunk[:MAX_DOWNLOAD_BYTES - received]
+                received += len(chunk)
+                parts.append(decoder.decode(chunk))
+                if received >= MAX_DOWNLOAD_BYTES:
+                    truncated = True
+                    break
+                if time.monotonic() > deadline:
+                    span.set_outcome("timeout")
+                    raise FetchRejected(f"download took longer than {FETCH_TIMEOUT_SECONDS}s", "timeout")
+            if decoder is not None:
+                parts.append(decoder.decode(b"", final=True))
+
+        span.add_bytes(received)
+        if truncated:
+            span.set_outcome("truncated")
+        return "".join(parts), truncated, response_validators
+
+
+def _parse_html(downloaded):
+    """Converts downloaded HTML into markdown. Runs inside the parse process pool."""
+    import trafilatura  # Only the parse workers (and the in-process fallback) need it
+    return trafilatura.extract(downloaded, output_format='markdown', include_links=True, include_images=False)
+
+
+def _parse_in_pool(downloaded):
+    """Parses HTML in the process pool, falling back to in-process parsing if the pool broke."""
+    with tracing.span("extractor.parse") as span:
+        span.add_bytes(len(downloaded))
+        try:
+            extracted_text = _get_parse_pool().submit(_parse_html, downloaded).result(timeout=PARSE_TIMEOUT_SECONDS)
+        except BrokenProcessPool:
+            _reset_parse_pool()
+            extracted_text = _parse_html(downloaded)
+        if not extracted_text:
+            span.set_outcome("empty")
+        return extracted_text
+
+
+def _extract_one(url, validators=None):
+    """
+    Fetches and parses a single URL, conditionally if `validators` are given. The fetch
+    goes through the scheduler, which retries transient failures and skips hosts whose
+    circuit breaker is open.
+    Returns a tuple of (article dict or None, list of (level, message) status tuples).
+    Articles carry the response's 'etag' and 'last_modified'; when the site reports the
+    page unchanged, the article is {'url': url, 'not_modified': True} instead.
+    """
+    messages = [("info", f"Extracting content from: {url}")]
+    try:
+        # The scheduler holds the host's slot per attempt (not during backoff), and takes
+        # it before the in-flight budget so fetches waiting on a busy host don't hold budget
+        downloaded, truncated, response_validators = scheduler.call(
+            "articles", _fetch, url, validators, breaker_key=urlparse(url).netloc.lower(), slot=_get_host_semaphore(url)
+        )
+        if not downloaded:
+            messages.append(("warning", f"Failed to download content from {url}: empty page. Skipping."))
+            return None, messages
+        if truncated:
+            messages.append(("warning", f"{url} is larger than {MAX_DOWNLOAD_BYTES // 1024} KB; only the beginning was used."))
+
+        extracted_text = _parse_in_pool(downloaded)
+        if not extracted_text:
+            messages.append(("warning", f"Could not extract content from {url}. Skipping."))
+            return None, messages
+
+        return dict(response_validators, url=url, markdown_content=extracted_text), messages
+    except NotModified:
+        messages.append(("info", f"Unchanged since the last fetch: {url}"))
+        return {"url": url, "not_modified": True}, messages
+    except FetchRejected as e:
+        messages.append(("warning", f"Skipped {url}: {e.reason}."))
+    except (scheduler.TransientError, scheduler.CircuitOpenError) as e:
+        messages.append(("warning", f"Skipped {url}: {e}."))
+    except FutureTimeoutError:
+        messages.append(("error", f"Timed out parsing content from {url}."))
+    except requests.exceptions.RequestException as e:
+        messages.append(("error", f"Network error while fetching {url}: {e}"))
+    except Exception as e:
+        messages.append(("error", f"Error extracting content from {url}: {e}"))
+    return None, messages
+
+
+def extract_content_from_urls(urls, max_workers=None):
     """
     Extracts main content from a list of URLs using trafilatura.
-    Returns a list of dictionaries with 'url' and 'markdown_content'.
+    Fetches run concurrently (bounded overall and per host) and parsing runs in a process pool.
+    Returns a tuple of (articles, status_messages): articles is a list of dictionaries with
+    'url' and 'markdown_content' in input order, and status_messages is a list of
+    (level, message) tuples for the caller to display.
     """
+    if not urls:
+        return [], []
+
+    workers = max(1, min(max_workers or MAX_CONCURRENT_FETCHES, len(urls)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extractor") as executor:
+        results = list(executor.map(tracing.bind(_extract_one), urls))
+
     extracted_articles = []
-    for url in urls:
-        try:
-            st.info(f"Extracting content from: {url}")
-            downloaded = trafilatura.fetch_url(url)
-            if downloaded:
-                # trafilatura.extract returns markdown by default if output_format='markdown'
-                # or plain text if output_format='text'
-                # For simplicity, let's aim for plain text or markdown directly from extract
-                extracted_text = trafilatura.extract(downloaded, output_format='markdown', include_links=True, include_images=False)
-                if extracted_text:
-                    extracted_articles.append({
-                        "url": url,
-                        "markdown_content": extracted_text
-                    })
-                else:
-                    st.warning(f"Could not extract content from {url}. Skipping.")
-            else:
-                st.warning(f"Failed to download content from {url}. Skipping.")
-        except requests.exceptions.RequestException as e:
-            st.error(f"Network error while fetching {url}: {e}")
-        except Exception as e:
-            st.error(f"Error extracting content from {url}: {e}")
-    return extracted_articles
\ No newline at end of file
+    status_messages = []
+    for article, messages in results:
+        status_messages.extend(messages)
+        if article:
+            extracted_articles.append(article)
+    return extracted_articles, status_messages
+
+
+def iter_extracted_articles(urls, max_workers=None, validators=None):
+    """
+    Extracts URLs concurrently like extract_content_from_urls, but yields
+    (article or None, status_messages) for each URL as soon as it finishes.
+    `validators` maps URLs to the {'etag', 'last_modified'} of a stored copy; those
+    URLs are fetched conditionally and yield a 'not_modified' article on a 304.
+    """
+    if not urls:
+        return
+
+    workers = max(1, min(max_workers or MAX_CONCURRENT_FETCHES, len(urls)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extractor")
+    try:
+        extract_one = tracing.bind(_extract_one)
+        futures = [executor.submit(extract_one, url, (validators or {}).get(url)) for url in urls]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Don't block a consumer that stopped early on the remaining downloads
+        executor.shutdown(wait=False)
@@ -1,103 +1,591 @@
-import streamlit as st
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from datetime import datetime
+import io
+import os
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+from datetime import datetime, timezone
+from modules import clients, tracing, article_store, scheduler
+from modules.cache import normalize_company_name
+from modules.urls import normalize_url
 
-def get_or_create_folder(service, folder_name, parent_id=None):
+ROOT_FOLDER_NAME = "Sales Research"
+UPLOAD_WORKERS = int(os.getenv("DRIVE_UPLOAD_WORKERS", "4"))
+# Files up to this size go in a single multipart request instead of a resumable session
+SIMPLE_UPLOAD_MAX_BYTES = int(os.getenv("DRIVE_SIMPLE_UPLOAD_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# Each company folder holds a manifest of what was saved, which incremental refreshes diff against
+MANIFEST_FILE_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+FOLDER_TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+
+# Drive permission IDs per credentials key. The credentials key changes with the token, the
+# permission ID never does, so it keys the root folder cache and upload dedupe
+_drive_user_ids = {}
+MAX_CACHED_USER_IDS = 1000
+
+# Root folder IDs per Drive user, so repeated saves skip the files().list search
+_root_folder_ids = {}
+_root_folder_ids_lock = threading.Lock()
+_root_folder_lookup_lock = threading.Lock()
+
+def _discard(message, level="info"):
+    """Default `report` callback: status messages are dropped."""
+
+
+# Long-lived upload threads keep their per-thread Drive connections alive between saves
+_upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="drive-upload")
+
+
+def get_or_create_folder(service, folder_name, parent_id=None, report=_discard):
     """
-    Checks if a folder exists, creates it if not, and returns its ID.
+    Checks if a folder exists, creates it if not, and returns its ID. Raises on Drive
+    errors, so a failed lookup is never mistaken for a missing folder.
     """
-    try:
-        # Search for the folder
-        query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        if parent_id:
-            query += f" and '{parent_id}' in parents"
+    # Search for the folder
+    query = f"name='{_quote(folder_name)}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+    if parent_id:
+        query += f" and '{parent_id}' in parents"
+
+    with tracing.span("drive.files.list"):
+        request = service.files().list(q=query, spaces='drive', fields='files(id, name)')
+        response = scheduler.call("drive", request.execute)
+    files = response.get('files', [])
+
+    if files:
+        # Folder found
+        return files[0]['id']
+    # Folder not found, create it
+    folder_id, _ = create_folder(service, folder_name, parent_id, report)
+    return folder_id
+
+
+def create_folder(service, folder_name, parent_id=None, report=_discard):
+    """
+    Creates a folder and returns (folder_id, webViewLink) from the create response.
+    """
+    file_metadata = {
+        'name': folder_name,
+        'mimeType': 'application/vnd.google-apps.folder'
+    }
+    if parent_id:
+        file_metadata['parents'] = [parent_id]
+
+    with tracing.span("drive.files.create", labels={"kind": "folder"}):
+        request = service.files().create(body=file_metadata, fields='id, webViewLink')
+        folder = scheduler.call("drive", request.execute)
+    report(f"Created Google Drive folder: {folder_name}", level="success")
+    return folder.get('id'), folder.get('webViewLink')
+
+
+def get_drive_user_id(service, credentials):
+    """Returns the Drive permission ID of the signed-in user: a stable key for per-user state."""
+    key = clients.credentials_key(credentials)
+    with _root_folder_ids_lock:
+        user_id = _drive_user_ids.get(key)
+    if user_id:
+        return user_id
+    with tracing.span("drive.about.get"):
+        request = service.about().get(fields='user(permissionId)')
+        user_id = scheduler.call("drive", request.execute)['user']['permissionId']
+    with _root_folder_ids_lock:
+        if len(_drive_user_ids) >= MAX_CACHED_USER_IDS:
+            _drive_user_ids.clear() # Tokens rotate hourly; old keys are never looked up again
+        _drive_user_ids[key] = user_id
+    return user_id
+
+
+def get_root_folder_id(service, credentials, refresh=False, report=_discard):
+    """
+    Returns the user's "Sales Research" folder ID, cached per Drive user for the life of
+    the process. Raises on Drive errors.
+    """
+    key = get_drive_user_id(service, credentials)
+    with _root_folder_ids_lock:
+        folder_id = None if refresh else _root_folder_ids.get(key)
+    if folder_id:
+        return folder_id
+
+    # One lookup at a time, so concurrent first saves don't each create a root folder
+    with _root_folder_lookup_lock:
+        with _root_folder_ids_lock:
+            folder_id = None if refresh else _root_folder_ids.get(key)
+        if folder_id:
+            return folder_id
+        folder_id = get_or_create_folder(service, ROOT_FOLDER_NAME, report=report)
+        with _root_folder_ids_lock:
+            _root_folder_ids[key] = folder_id
+    return folder_id
+
+
+def create_text_file(service, folder_id, file_name, content, mime_type='text/plain'):
+    """
+    Creates a text file in a Drive folder and returns the create response with 'id' and
+    'webViewLink'. Raises on failure. Small files use a single multipart upload; larger
+    ones a resumable session.
+    """
+    data = content.encode('utf-8')
+    file_metadata = {
+        'name': file_name,
+        'parents': [folder_id]
+    }
+    media = MediaIoBaseUpload(
+        io.BytesIO(data),
+        mimetype=mime_type,
+        resumable=len(data) > SIMPLE_UPLOAD_MAX_BYTES
+    )
+    with tracing.span("drive.files.create", labels={"kind": "file"}, file_name=file_name) as span:
+        span.add_bytes(len(data))
+        request = service.files().create(body=file_metadata, media_body=media, fields='id, webViewLink')
+        return scheduler.call("drive", request.execute)
 
-        response = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-        files = response.get('files', [])
 
-        if files:
-            # Folder found
-            return files[0]['id']
+def create_shortcut(service, folder_id, file_name, target_id):
+    """
+    Creates a Drive shortcut to an existing file and returns the create response with
+    'id' and 'webViewLink'. Raises on failure.
+    """
+    file_metadata = {
+        'name': file_name,
+        'mimeType': 'application/vnd.google-apps.shortcut',
+        'shortcutDetails': {'targetId': target_id},
+        'parents': [folder_id]
+    }
+    with tracing.span("drive.files.create", labels={"kind": "shortcut"}, file_name=file_name):
+        request = service.files().create(body=file_metadata, fields='id, webViewLink')
+        return scheduler.call("drive", request.execute)
+
+
+def update_text_file(service, file_id, content, mime_type='text/plain'):
+    """
+    Replaces the content of an existing Drive file, keeping its ID and link.
+    Returns the update response with 'id' and 'webViewLink'. Raises on failure.
+    """
+    data = content.encode('utf-8')
+    media = MediaIoBaseUpload(
+        io.BytesIO(data),
+        mimetype=mime_type,
+        resumable=len(data) > SIMPLE_UPLOAD_MAX_BYTES
+    )
+    with tracing.span("drive.files.update", labels={"kind": "file"}, file_id=file_id) as span:
+        span.add_bytes(len(data))
+        request = service.files().update(fileId=file_id, media_body=media, fields='id, webViewLink')
+        return scheduler.call("drive", request.execute)
+
+
+def _upload_or_link(service, user_key, folder_id, file_name, content, mime_type, content_hash):
+    """
+    Uploads a file, or creates a shortcut when the user already has a file with this
+    content hash in Drive. Returns (file, linked), where file is the create response with
+    'id' and 'webViewLink'.
+    """
+    store = article_store.get_store()
+    existing = store.get_drive_file(user_key, content_hash) if content_hash else None
+    if existing:
+        try:
+            return create_shortcut(service, folder_id, file_name, existing[0]), True
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # The earlier copy was deleted; upload the content again
+            store.forget_drive_file(user_key, content_hash)
+
+    file = create_text_file(service, folder_id, file_name, content, mime_type)
+    if content_hash:
+        store.set_drive_file(user_key, content_hash, file.get('id'), file.get('webViewLink'))
+    return file, False
+
+
+def upload_text_files(credentials, folder_id, files, content_hashes=None, report=_discard):
+    """
+    Uploads several (file_name, content, mime_type) tuples concurrently on the shared
+    upload pool. Each worker uses its own per-thread Drive service from the client
+    registry. `content_hashes` (aligned with files, None entries allowed) lets files the
+    user already uploaded become shortcuts to the earlier copy instead of new uploads.
+    Returns the created files as dicts with 'id' and 'webViewLink' (None for failed
+    uploads) in input order.
+    """
+    user_key = get_drive_user_id(clients.get_service('drive', 'v3', credentials), credentials)
+    hashes = content_hashes or [None] * len(files)
+
+    def upload(file_spec, content_hash):
+        file_name, content, mime_type = file_spec
+        try:
+            service = clients.get_service('drive', 'v3', credentials)
+            return _upload_or_link(service, user_key, folder_id, file_name, content, mime_type, content_hash), None
+        except Exception as e:
+            return (None, False), e
+
+    results = list(_upload_pool.map(tracing.bind(upload), files, hashes))
+
+    created = []
+    for (file_name, _, _), ((file, linked), error) in zip(files, results):
+        if error:
+            report(f"Error uploading file '{file_name}': {error}", level="error")
+        elif linked:
+            report(f"Linked '{file_name}' to the copy already in Google Drive.", level="success")
         else:
-            # Folder not found, create it
-            file_metadata = {
-                'name': folder_name,
-                'mimeType': 'application/vnd.google-apps.folder'
-            }
-            if parent_id:
-                file_metadata['parents'] = [parent_id]
-            
-            folder = service.files().create(body=file_metadata, fields='id').execute()
-            st.success(f"Created Google Drive folder: {folder_name}")
-            return folder.get('id')
-    except Exception as e:
-        st.error(f"Error getting or creating folder '{folder_name}': {e}")
-        return None
+            report(f"Uploaded '{file_name}' to Google Drive.", level="success")
+        created.append(file)
+    return created
+
+
+def _report_files(research_results):
+    """Returns the (file_name, content, mime_type) tuples for the Gemini report files."""
+    competitors_content = "\n".join(research_results.get("competitors", ["No competitors listed."]))
+    return [
+        ("company_overview.txt", research_results.get("overview", "No overview available."), 'text/plain'),
+        ("competitors.txt", competitors_content, 'text/plain'),
+    ]
+
+
+# Research field each report file is written from
+_REPORT_FILE_FIELDS = {"company_overview.txt": "overview", "competitors.txt": "competitors"}
+
+
+def _article_file(article, number):
+    """Returns the (file_name, content, mime_type) tuple for an extracted article."""
+    content = f"# {article.get('title', 'Untitled Article')}\n\nSource: {article.get('url', 'N/A')}\n\n{article.get('markdown_content', 'No content extracted.')}"
+    return (f"article_{number}.md", content, 'text/markdown')
+
 
-def upload_text_file(service, folder_id, file_name, content, mime_type='text/plain'):
+def _manifest_article(article, file_name, file):
+    return {
+        "url": article.get('url'),
+        "title": article.get('title'),
+        "content_hash": article.get('content_hash'),
+        "file_name": file_name,
+        "file_id": file.get('id'),
+    }
+
+
+def _write_manifest(service, folder_id, manifest, manifest_file_id=None):
+    """Creates the folder's manifest, or updates it in place when manifest_file_id is given."""
+    content = json.dumps(manifest, indent=2)
+    if manifest_file_id:
+        update_text_file(service, manifest_file_id, content, 'application/json')
+    else:
+        create_text_file(service, folder_id, MANIFEST_FILE_NAME, content, 'application/json')
+
+
+def save_research_to_drive(credentials, company_name, research_results, extracted_articles, report=_discard):
     """
-    Uploads text content as a file to a specified Google Drive folder.
+    Saves research results and extracted articles to Google Drive, together with a
+    manifest used by later incremental refreshes (see refresh_research_in_drive).
+    Returns the URL to the created company-specific folder, or None on failure.
+    Progress and errors are passed to report(message, level) (e.g. Job.progress),
+    since this usually runs on a worker thread.
     """
     try:
-        file_metadata = {
-            'name': file_name,
-            'parents': [folder_id]
+        service = clients.get_service('drive', 'v3', credentials)
+
+        # 1. Get or create root "Sales Research" folder (cached per user)
+        root_folder_id = get_root_folder_id(service, credentials, report=report)
+
+        # 2. Create a new subfolder named after the company with a timestamp
+        timestamp = datetime.now().strftime(FOLDER_TIMESTAMP_FORMAT)
+        company_folder_name = f"{company_name}_{timestamp}"
+        try:
+            company_folder_id, company_folder_link = create_folder(service, company_folder_name, root_folder_id, report)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # The cached root folder was deleted or trashed; look it up again
+            root_folder_id = get_root_folder_id(service, credentials, refresh=True, report=report)
+            company_folder_id, company_folder_link = create_folder(service, company_folder_name, root_folder_id, report)
+
+        # 3. Save Gemini research results and extracted Markdown articles in parallel
+        report("Saving Gemini research reports and extracted articles...")
+        files = _report_files(research_results)
+        # Articles from the article store carry a content hash, so copies the user
+        # already has in Drive (e.g. from another company's research) become shortcuts
+        content_hashes = [None, None]
+        for i, article in enumerate(extracted_articles):
+            files.append(_article_file(article, i + 1))
+            content_hashes.append(article.get('content_hash'))
+        created = upload_text_files(credentials, company_folder_id, files, content_hashes, report)
+
+        # 4. Record what was saved. Failed uploads are left out, so a refresh retries them
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "company": company_name,
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "competitors": list(research_results.get("competitors", [])),
+            "files": {
+                file_name: {"id": file.get('id'), "content_hash": article_store.content_hash(content)}
+                for (file_name, content, _), file in zip(files[:2], created[:2]) if file
+            },
+            "articles": [
+                _manifest_article(article, file_name, file)
+                for article, (file_name, _, _), file in zip(extracted_articles, files[2:], created[2:]) if file
+            ],
         }
-        media = MediaFileUpload(
-            filename=None, # No local file, content is in memory
-            mimetype=mime_type,
-            body=content,
-            resumable=True
-        )
-        file = service.files().create(body=file_metadata, media_body=media, fields='id, webViewLink').execute()
-        st.success(f"Uploaded '{file_name}' to Google Drive.")
-        return file.get('webViewLink')
+        try:
+            _write_manifest(service, company_folder_id, manifest)
+        except Exception as e:
+            report(f"Could not save the research manifest; the next refresh will start a new folder: {e}", level="warning")
+
+        return company_folder_link
+
     except Exception as e:
-        st.error(f"Error uploading file '{file_name}': {e}")
+        report(f"Error saving research to Google Drive: {e}", level="error")
         return None
 
-def save_research_to_drive(credentials, company_name, research_results, extracted_articles):
+
+# '{company_name}_{timestamp}', as named by save_research_to_drive
+_COMPANY_FOLDER_PATTERN = re.compile(r"(.+)_(\d{8}_\d{6})", re.DOTALL)
+
+
+def _quote(value):
+    """Escapes a string for use inside a quoted Drive query value."""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def find_latest_company_folder(service, root_folder_id, company_name):
     """
-    Saves research results and extracted articles to Google Drive.
-    Returns the URL to the created company-specific folder.
+    Returns the newest '{company_name}_{timestamp}' folder in the root folder as a dict
+    with 'id', 'name' and 'webViewLink', or None if there is none. Names are compared
+    like cache keys (cache.normalize_company_name), so "Acme Inc." finds "Acme Inc_...".
+    Raises on Drive errors.
     """
+    # Drive's `name contains` can't match a normalized name, so every company folder is
+    # listed and compared here
+    query = (
+        f"mimeType='application/vnd.google-apps.folder' and '{root_folder_id}' in parents and trashed=false"
+    )
+    wanted = normalize_company_name(company_name)
+    latest, latest_timestamp = None, None
+    page_token = None
+    while True:
+        with tracing.span("drive.files.list"):
+            request = service.files().list(
+                q=query, spaces='drive', fields='nextPageToken, files(id, name, webViewLink)',
+                pageSize=1000, pageToken=page_token
+            )
+            response = scheduler.call("drive", request.execute)
+        for folder in response.get('files', []):
+            match = _COMPANY_FOLDER_PATTERN.fullmatch(folder['name'])
+            # The timestamp format sorts chronologically
+            if match and normalize_company_name(match.group(1)) == wanted and (
+                latest_timestamp is None or match.group(2) > latest_timestamp
+            ):
+                latest, latest_timestamp = folder, match.group(2)
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    return latest
+
+
+def read_manifest(service, folder_id):
+    """
+    Returns (manifest, file_id) for a company folder, or (None, None) when the folder has
+    no usable manifest (e.g. it was saved before manifests existed).
+    """
+    query = f"name='{MANIFEST_FILE_NAME}' and '{folder_id}' in parents and trashed=false"
+    with tracing.span("drive.files.list"):
+        request = service.files().list(q=query, spaces='drive', fields='files(id, name)')
+        files = scheduler.call("drive", request.execute).get('files', [])
+    if not files:
+        return None, None
+    with tracing.span("drive.files.get_media"):
+        request = service.files().get_media(fileId=files[0]['id'])
+        data = scheduler.call("drive", request.execute)
     try:
-        service = build('drive', 'v3', credentials=credentials)
+        manifest = json.loads(data)
+    except ValueError:
+        return None, None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None, None
+    return manifest, files[0]['id']
 
-        # 1. Get or create root "Sales Research" folder
-        root_folder_name = "Sales Research"
-        root_folder_id = get_or_create_folder(service, root_folder_name)
-        if not root_folder_id:
-            return None
 
-        # 2. Create a new subfolder named after the company with a timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        company_folder_name = f"{company_name}_{timestamp}"
-        company_folder_id = get_or_create_folder(service, company_folder_name, root_folder_id)
-        if not company_folder_id:
-            return None
-
-        # 3. Save Gemini research results
-        st.info("Saving Gemini research reports...")
-        overview_link = upload_text_file(service, company_folder_id, "company_overview.txt", research_results.get("overview", "No overview available."))
-        competitors_content = "\n".join(research_results.get("competitors", ["No competitors listed."]))
-        competitors_link = upload_text_file(service, company_folder_id, "competitors.txt", competitors_content)
-
-        # 4. Save extracted Markdown articles
-        st.info("Saving extracted articles...")
-        article_links = []
-        for i, article in enumerate(extracted_articles):
-            file_name = f"article_{i+1}.md"
-            content = f"# {article.get('title', 'Untitled Article')}\n\nSource: {article.get('url', 'N/A')}\n\n{article.get('markdown_content', 'No content extracted.')}"
-            link = upload_text_file(service, company_folder_id, file_name, content, mime_type='text/markdown')
-            if link:
-                article_links.append(link)
-        
-        # Get the webViewLink for the created company folder
-        company_folder_info = service.files().get(fileId=company_folder_id, fields='webViewLink').execute()
-        return company_folder_info.get('webViewLink')
+def find_previous_research(credentials, company_name, report=_discard):
+    """
+    Looks up the latest saved research for a company. Returns a dict with 'folder_id',
+    'folder_name', 'folder_link', 'manifest' and 'manifest_file_id', or None if there is
+    no earlier folder with a manifest. Raises on Drive errors, so an outage fails the
+    refresh instead of starting a duplicate full run.
+    """
+    service = clients.get_service('drive', 'v3', credentials)
+    root_folder_id = get_root_folder_id(service, credentials, report=report)
+    folder = find_latest_company_folder(service, root_folder_id, company_name)
+    if not folder:
+        return None
+    manifest, manifest_file_id = read_manifest(service, folder['id'])
+    if not manifest:
+        return None
+    return {
+        "folder_id": folder['id'],
+        "folder_name": folder['name'],
+        "folder_link": folder.get('webViewLink'),
+        "manifest": manifest,
+        "manifest_file_id": manifest_file_id,
+    }
+
+
+def new_article_urls(manifest, research_results):
+    """Returns the research's article URLs that a manifest doesn't have yet, without duplicates, in order."""
+    seen = {normalize_url(article['url']) for article in manifest.get('articles', []) if article.get('url')}
+    urls = []
+    for article in research_results.get('articles', []):
+        url = article.get('url')
+        if url and normalize_url(url) not in seen:
+            seen.add(normalize_url(url))
+            urls.append(url)
+    return urls
+
+
+def diff_research(manifest, research_results, new_articles):
+    """
+    Compares fresh research with a manifest. Returns a dict with 'new_articles',
+    'missing_urls' (saved articles the research no longer lists), 'competitors_added',
+    'competitors_removed', 'changed_files' (report files whose content changed) and
+    'not_refreshed' (fields Gemini failed to return, which count as unchanged).
+    """
+    errors = research_results.get('errors', {})
+    current_urls = {normalize_url(a['url']) for a in research_results.get('articles', []) if a.get('url')}
+    old_competitors = manifest.get('competitors', [])
+    new_competitors = research_results.get('competitors', [])
+    old_keys = {name.casefold() for name in old_competitors}
+    new_keys = {name.casefold() for name in new_competitors}
+    saved_files = manifest.get('files', {})
+    return {
+        "new_articles": list(new_articles),
+        "missing_urls": [] if 'articles' in errors else [
+            a['url'] for a in manifest.get('articles', []) if normalize_url(a['url']) not in current_urls
+        ],
+        "competitors_added": [] if 'competitors' in errors else [
+            name for name in new_competitors if name.casefold() not in old_keys
+        ],
+        "competitors_removed": [] if 'competitors' in errors else [
+            name for name in old_competitors if name.casefold() not in new_keys
+        ],
+        "changed_files": [
+            file_name for file_name, content, _ in _report_files(research_results)
+            if _REPORT_FILE_FIELDS[file_name] not in errors
+            and saved_files.get(file_name, {}).get('content_hash') != article_store.content_hash(content)
+        ],
+        "not_refreshed": [name for name in ("overview", "competitors", "articles") if name in errors],
+    }
+
+
+def summarize_changes(changes):
+    """Returns a one-line summary of a diff_research result."""
+    parts = [f"{len(changes['new_articles'])} new article(s)"]
+    if changes['competitors_added'] or changes['competitors_removed']:
+        parts.append(f"competitors +{len(changes['competitors_added'])}/-{len(changes['competitors_removed'])}")
+    parts.append("overview updated" if "company_overview.txt" in changes['changed_files'] else "overview unchanged")
+    if changes.get('not_refreshed'):
+        parts.append(f"not refreshed: {', '.join(changes['not_refreshed'])}")
+    return ", ".join(parts)
+
+
+def _changes_markdown(company_name, manifest, changes, article_files, refreshed_at):
+    lines = [
+        f"# What's new for {company_name}",
+        "",
+        f"Refreshed {refreshed_at}; compared with the research from {manifest.get('generated_at', 'an earlier run')}.",
+        "",
+        f"## New articles ({len(changes['new_articles'])})",
+    ]
+    lines += [
+        f"- [{article.get('title') or article['url']}]({article['url']}) ({file_name})"
+        for article, file_name in zip(changes['new_articles'], article_files)
+    ] or ["None."]
+    lines += ["", "## Competitors"]
+    if changes['competitors_added'] or changes['competitors_removed']:
+        lines += [f"- Added: {name}" for name in changes['competitors_added']]
+        lines += [f"- Removed: {name}" for name in changes['competitors_removed']]
+    else:
+        lines.append("No changes.")
+    lines += ["", "## Overview", "Updated." if "company_overview.txt" in changes['changed_files'] else "No changes."]
+    if changes.get('not_refreshed'):
+        lines += ["", "## Not refreshed", f"Gemini did not return: {', '.join(changes['not_refreshed'])}. The saved versions are kept."]
+    if changes['missing_urls']:
+        lines += ["", f"## Articles no longer found by research ({len(changes['missing_urls'])})"]
+        lines += [f"- {url} (kept in this folder)" for url in changes['missing_urls']]
+    return "\n".join(lines) + "\n"
+
+
+def refresh_research_in_drive(credentials, previous, company_name, research_results, new_articles, report=_discard):
+    """
+    Updates an earlier research folder (from find_previous_research) instead of creating
+    a new one: report files whose content changed are updated in place (files of fields
+    in research_results['errors'] are left as they were), `new_articles`
+    (articles whose URLs the manifest doesn't have) are uploaded after the existing ones,
+    a changes_{timestamp}.md summary is added when anything changed, and the manifest
+    is updated.
+    Returns the diff_research result with 'drive_link' and 'summary' added, or None on
+    failure. Progress and errors are passed to report(message, level).
+    """
+    try:
+        service = clients.get_service('drive', 'v3', credentials)
+        folder_id = previous['folder_id']
+        manifest = previous['manifest']
+        changes = diff_research(manifest, research_results, new_articles)
+        saved_files = dict(manifest.get('files', {}))
+
+        # 1. Report files: update changed ones in place, re-create any that were deleted
+        for file_name, content, mime_type in _report_files(research_results):
+            if file_name not in changes['changed_files']:
+                continue
+            file_id = saved_files.get(file_name, {}).get('id')
+            file = None
+            if file_id:
+                try:
+                    file = update_text_file(service, file_id, content, mime_type)
+                    report(f"Updated '{file_name}' in Google Drive.", level="success")
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+            if file is None:
+                file = create_text_file(service, folder_id, file_name, content, mime_type)
+                report(f"Uploaded '{file_name}' to Google Drive.", level="success")
+            saved_files[file_name] = {"id": file.get('id'), "content_hash": article_store.content_hash(content)}
+
+        # 2. New articles, numbered after the ones already in the folder
+        numbers = [
+            int(match.group(1)) for match in
+            (re.fullmatch(r"article_(\d+)\.md", a.get('file_name', '')) for a in manifest.get('articles', [])) if match
+        ]
+        files = [_article_file(article, max(numbers, default=0) + i + 1) for i, article in enumerate(new_articles)]
+        hashes = [a.get('content_hash') for a in new_articles]
+        created = upload_text_files(credentials, folder_id, files, hashes, report) if files else []
+
+        # 3. Summary of what changed since the last run (skipped when nothing did)
+        refreshed_at = datetime.now(timezone.utc)
+        if changes['new_articles'] or changes['changed_files'] or changes['competitors_added'] or changes['competitors_removed']:
+            changes_file_name = f"changes_{refreshed_at.astimezone().strftime(FOLDER_TIMESTAMP_FORMAT)}.md"
+            create_text_file(
+                service, folder_id, changes_file_name,
+                _changes_markdown(company_name, manifest, changes, [f[0] for f in files], refreshed_at.isoformat(timespec='seconds')),
+                'text/markdown'
+            )
+            report(f"Uploaded '{changes_file_name}' to Google Drive.", level="success")
+
+        # 4. The manifest now describes the refreshed folder. Fields Gemini failed to return keep their saved values
+        if 'competitors' in research_results.get('errors', {}):
+            competitors = manifest.get('competitors', [])
+        else:
+            competitors = list(research_results.get("competitors", []))
+        manifest = dict(
+            manifest,
+            generated_at=refreshed_at.isoformat(timespec='seconds'),
+            competitors=competitors,
+            files=saved_files,
+            articles=manifest.get('articles', []) + [
+                _manifest_article(article, file_name, file)
+                for article, (file_name, _, _), file in zip(new_articles, files, created) if file
+            ],
+        )
+        _write_manifest(service, folder_id, manifest, previous['manifest_file_id'])
+
+        changes['drive_link'] = previous['folder_link']
+        changes['summary'] = summarize_changes(changes)
+        return changes
 
     except Exception as e:
-        st.error(f"Error saving research to Google Drive: {e}")
-        return None
\ No newline at end of file
+        report(f"Error refreshing research in Google Drive: {e}", level="error")
+        return None
@@ -1,56 +1,284 @@
 import os
-import google.generativeai as genai
-import streamlit as st
+import re
+import json
+import time
+import threading
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
-def research_company(company_name):
+from modules import tracing, scheduler
+from modules.urls import dedupe_articles
+
+# JSON mode with a response schema needs a Gemini 1.5 or later model
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+PROMPT_TIMEOUT_SECONDS = float(os.getenv("GEMINI_PROMPT_TIMEOUT", "60"))
+# Total time for the research request including retries of transient failures
+RESEARCH_TIMEOUT_SECONDS = float(os.getenv("GEMINI_RESEARCH_TIMEOUT", str(2 * PROMPT_TIMEOUT_SECONDS)))
+MAX_CONCURRENT_PROMPTS = int(os.getenv("GEMINI_MAX_CONCURRENCY", "6"))
+
+_model = None
+_model_lock = threading.Lock()
+
+# Shared by every research call so prompts from concurrent sessions are bounded together
+_prompt_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PROMPTS, thread_name_prefix="gemini")
+
+
+def get_model():
+    """
+    Returns the process-wide Gemini model client, configuring it on first use.
+    google.generativeai is imported here rather than at module load (it takes about a second).
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            _model = genai.GenerativeModel(MODEL_NAME)
+        return _model
+
+
+# Response schema for the single structured research request (JSON mode)
+RESEARCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overview": {"type": "string"},
+        "competitors": {"type": "array", "items": {"type": "string"}},
+        "articles": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"title": {"type": "string"}, "url": {"type": "string"}},
+                "required": ["title", "url"]
+            }
+        }
+    },
+    "required": ["overview", "competitors", "articles"]
+}
+
+RESEARCH_FIELDS = ("overview", "competitors", "articles")
+
+
+@dataclass
+class Article:
+    title: str
+    url: str
+
+
+@dataclass
+class ResearchResult:
+    """Validated research for one company. Fields that failed validation are listed in `errors`."""
+    overview: str = "Error: Could not retrieve overview."
+    competitors: list = field(default_factory=list)
+    articles: list = field(default_factory=list)
+    errors: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        Validates parsed model output. Each field is checked on its own, so one bad
+        field is reported in `errors` without discarding the others.
+        """
+        result = cls()
+        if not isinstance(data, dict):
+            result.errors = {name: "Response was not a JSON object." for name in RESEARCH_FIELDS}
+            return result
+
+        overview = data.get("overview")
+        if isinstance(overview, str) and overview.strip():
+            result.overview = overview.strip()
+        else:
+            result.errors["overview"] = "Missing or empty overview."
+
+        competitors = data.get("competitors")
+        if isinstance(competitors, str):
+            competitors = competitors.split(",")
+        if isinstance(competitors, list):
+            result.competitors = [name for name in (_clean_text(c) for c in competitors if isinstance(c, str)) if name]
+        else:
+            result.errors["competitors"] = "Competitors were not a list."
+
+        articles = data.get("articles")
+        if isinstance(articles, list):
+            candidates = [
+                {"title": _clean_text(a.get("title") or "") or "Untitled Article", "url": a.get("url") or a.get("link") or ""}
+                for a in articles if isinstance(a, dict)
+            ]
+            result.articles = [Article(**a) for a in dedupe_articles(candidates)]
+        else:
+            result.errors["articles"] = "Articles were not a list."
+        return result
+
+    def to_dict(self):
+        """Returns the plain dict shape used by the rest of the app and the cache."""
+        return asdict(self)
+
+
+def build_overview_prompt(company_name):
+    """Returns the plain-text overview prompt used for streaming."""
+    return f"Provide a concise overview of {company_name}, including its primary business, industry, and key products/services. Keep it to 3-4 sentences."
+
+
+def build_research_prompt(company_name):
+    """Returns the single prompt asking for overview, competitors and articles as JSON."""
+    return (
+        f"Research the company {company_name}. Respond with a JSON object with these fields:\n"
+        f"- overview: a concise 3-4 sentence overview of {company_name}, including its primary business, industry, and key products/services.\n"
+        f"- competitors: the names of the top 3-5 direct competitors of {company_name}.\n"
+        f"- articles: 3-5 recent and relevant news articles or reports about {company_name} or its industry, each with its title and full URL. Ensure URLs are complete and functional."
+    )
+
+
+def _clean_text(text):
+    """Strips markdown bullets, numbering and emphasis markers models add around values."""
+    text = re.sub(r"^\s*(?:[-*+\u2022]|\d+[.)])\s*", "", text)
+    return text.replace("**", "").replace("__", "").strip().strip("*_`\"'").strip()
+
+
+def _load_json(text):
+    """Parses JSON from model output, tolerating code fences, surrounding prose and trailing commas."""
+    text = (text or "").strip()
+    candidates = [text]
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        candidates.append(fenced.group(1))
+    if "{" in text and "}" in text:
+        candidates.append(text[text.index("{"):text.rindex("}") + 1])
+    for candidate in candidates:
+        for attempt in (candidate, re.sub(r",\s*([}\]])", r"\1", candidate)):
+            try:
+                return json.loads(attempt)
+            except ValueError:
+                continue
+    return None
+
+
+def _parse_loose_text(text):
+    """
+    Fallback for responses that are not JSON at all. Understands "Overview:",
+    "Competitors:", "Title:"/"URL:" lines and markdown links, with or without
+    bullets, numbering or bold markers.
+    """
+    data = {"overview": "", "competitors": [], "articles": []}
+    current_article = None
+    for raw_line in (text or "").split("\n"):
+        line = _clean_text(raw_line)
+        label, _, value = line.partition(":")
+        label = _clean_text(label).casefold()
+        value = _clean_text(value)
+        link = re.search(r"\[([^\]]+)\]\((https?://[^)\s]+)\)", line)
+        if label == "overview":
+            data["overview"] = value
+        elif label == "competitors":
+            data["competitors"] = value.split(",")
+        elif label == "title":
+            current_article = {"title": value, "url": ""}
+            data["articles"].append(current_article)
+        elif label in ("url", "link", "source") and current_article is not None:
+            current_article["url"] = value
+        elif link:
+            data["articles"].append({"title": link.group(1), "url": link.group(2)})
+    return data
+
+
+def parse_research_response(text):
+    """Parses and validates a research response into a ResearchResult."""
+    data = _load_json(text)
+    if data is None:
+        data = _parse_loose_text(text)
+        if not any(data.values()):
+            data = None # Nothing recognizable, so every field is reported as failed
+    return ResearchResult.from_data(data)
+
+
+def _generate_research(model, company_name, deadline=None):
+    """Sends the structured research request through the scheduler and returns the raw response text."""
+    import google.generativeai as genai
+    with tracing.span("gemini.generate", labels={"prompt": "research"}) as span:
+        response = scheduler.call(
+            "gemini",
+            model.generate_content,
+            build_research_prompt(company_name),
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=RESEARCH_SCHEMA
+            ),
+            request_options={"timeout": PROMPT_TIMEOUT_SECONDS},
+            deadline=deadline
+        )
+        text = response.text if response else ""
+        span.add_bytes(len(text.encode("utf-8")))
+        return text
+
+
+def submit_research(company_name, model=None):
+    """Sends the structured research request on the shared pool and returns its future."""
+    deadline = time.monotonic() + RESEARCH_TIMEOUT_SECONDS
+    return _prompt_pool.submit(tracing.bind(_generate_research), model or get_model(), company_name, deadline)
+
+
+def collect_research(future, timeout=None):
+    """
+    Waits for a submit_research future and returns validated results as a dict.
+    A failed or timed-out request reports every field under 'errors'.
+    """
+    try:
+        return parse_research_response(future.result(timeout=timeout or RESEARCH_TIMEOUT_SECONDS)).to_dict()
+    except FutureTimeoutError:
+        future.cancel()
+        error = "Timed out waiting for Gemini."
+    except Exception as e:
+        error = str(e)
+    return ResearchResult(errors={name: error for name in RESEARCH_FIELDS}).to_dict()
+
+
+def stream_overview(company_name, errors, model=None):
+    """
+    Yields the company overview text chunk by chunk as Gemini generates it.
+    A failure ends the stream and is recorded in `errors` under 'overview'.
+    """
+    with tracing.span("gemini.generate", labels={"prompt": "overview_stream"}) as span:
+        try:
+            model = model or get_model()
+            response = scheduler.call(
+                "gemini",
+                model.generate_content,
+                build_overview_prompt(company_name),
+                stream=True,
+                request_options={"timeout": PROMPT_TIMEOUT_SECONDS}
+            )
+            for chunk in response:
+                if chunk.text:
+                    span.add_bytes(len(chunk.text.encode("utf-8")))
+                    yield chunk.text
+        except Exception as e:
+            span.set_outcome("error")
+            span.set(error=str(e))
+            errors["overview"] = str(e)
+
+
+def research_company(company_name, model=None, timeout=None, report=None):
     """
     Researches a company using the Gemini API and returns structured information
     including overview, competitors, and relevant articles with source URLs.
+
+    Uses one JSON-mode request validated against RESEARCH_SCHEMA, falling back to
+    tolerant parsing for malformed output. Article URLs are normalized and
+    deduplicated. Fields that fail validation keep their default value and are
+    reported under 'errors', so callers still get the parts that succeeded.
+    `model` can be any object with a `generate_content(prompt, **kwargs)` method
+    and defaults to the shared client. Status messages go to report(message, level).
     """
+    report = report or (lambda message, level="info": None)
+    report(f"Asking Gemini about {company_name} overview, competitors and relevant articles...")
     try:
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        model = genai.GenerativeModel('gemini-pro')
-
-        st.info(f"Asking Gemini about {company_name} overview...")
-        overview_prompt = f"Provide a concise overview of {company_name}, including its primary business, industry, and key products/services. Keep it to 3-4 sentences."
-        overview_response = model.generate_content(overview_prompt)
-        overview = overview_response.text if overview_response else "N/A"
-
-        st.info(f"Asking Gemini about {company_name} competitors...")
-        competitors_prompt = f"List the top 3-5 direct competitors of {company_name}. Provide only their names, separated by commas."
-        competitors_response = model.generate_content(competitors_prompt)
-        competitors = [c.strip() for c in competitors_response.text.split(',') if c.strip()] if competitors_response else []
-
-        st.info(f"Asking Gemini for relevant articles about {company_name} and its industry...")
-        articles_prompt = f"Find 3-5 recent and relevant news articles or reports about {company_name} or its industry. For each, provide the title and the full URL. Format as: 'Title: [Title]\nURL: [URL]'. Ensure URLs are complete and functional."
-        articles_response = model.generate_content(articles_prompt)
-        articles_text = articles_response.text if articles_response else ""
-
-        articles = []
-        # Simple parsing for "Title: ...\nURL: ..." format
-        lines = articles_text.split('\n')
-        current_article = {}
-        for line in lines:
-            if line.startswith("Title:"):
-                if current_article: # Save previous article if exists
-                    articles.append(current_article)
-                current_article = {"title": line.replace("Title:", "").strip(), "url": ""}
-            elif line.startswith("URL:"):
-                if current_article:
-                    current_article["url"] = line.replace("URL:", "").strip()
-        if current_article: # Add the last article
-            articles.append(current_article)
-
-        return {
-            "overview": overview,
-            "competitors": competitors,
-            "articles": articles
-        }
-
+        with tracing.span("gemini.research_company") as span:
+            results = collect_research(submit_research(company_name, model=model), timeout=timeout)
+            if results["errors"]:
+                span.set_outcome("partial" if len(results["errors"]) < len(RESEARCH_FIELDS) else "error")
     except Exception as e:
-        st.error(f"Error interacting with Gemini API: {e}")
-        return {
-            "overview": "Error: Could not retrieve overview.",
-            "competitors": [],
-            "articles": []
-        }
\ No newline at end of file
+        report(f"Error interacting with Gemini API: {e}", level="error")
+        return ResearchResult(errors={name: str(e) for name in RESEARCH_FIELDS}).to_dict()
+
+    for name, error in results["errors"].items():
+        report(f"Gemini {name} request failed: {error}", level="warning")
+    return results
@@ -0,0 +1,304 @@
+import os
+import time
+import uuid
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import cache, gdrive, tracing, state
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+MAX_JOBS_PER_USER = int(os.getenv("MAX_JOBS_PER_USER", "2"))
+# Replicas refresh the heartbeat of the jobs they run; an active job whose heartbeat is
+# older than JOB_STALE_SECONDS belonged to a replica that stopped and shows as interrupted
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "5"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "30"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+JOBS_KEPT_PER_USER = 50
+EVENTS_KEPT_PER_JOB = 200
+
+ACTIVE_STATUSES = ("queued", "running", "cancelling")
+
+REPLICA_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobLimitError(Exception):
+    """Raised when a user already has the maximum number of active jobs."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when the job has been cancelled."""
+
+
+class Job:
+    """Handle passed to job functions for reporting progress and checking for cancellation."""
+
+    def __init__(self, job_queue, job_id, user):
+        self.id = job_id
+        self.user = user
+        self.cancel_event = threading.Event()
+        self._queue = job_queue
+
+    def progress(self, message, level="info"):
+        """Records a progress event for the job."""
+        self._queue._add_event(self.id, level, message)
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Raises JobCancelled if the job has been cancelled."""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+
+class JobQueue:
+    """
+    Runs research jobs on a worker pool outside the Streamlit script thread.
+    Job state and progress events are kept in the shared state backend, so the UI on
+    any replica can pick a job back up after a rerun, browser refresh or reconnect.
+    Identical active jobs (same user and dedup key) are submitted once, and each user
+    has a limit on active jobs. Cancelling works from any replica: the replica running
+    the job sees the 'cancelling' status on its next heartbeat.
+    """
+
+    def __init__(self, backend=None, workers=JOB_WORKERS, max_jobs_per_user=MAX_JOBS_PER_USER):
+        self.max_jobs_per_user = max_jobs_per_user
+        self._backend = backend or state.get_backend()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._events_lock = threading.Lock()
+        threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True).start()
+
+    def submit(self, user, title, fn, *args, dedup_key=None, **kwargs):
+        """
+        Queues fn(job, *args, **kwargs) and returns the job ID. If the user already has an
+        active job with the same dedup_key, that job's ID is returned instead.
+        Raises JobLimitError when the user has reached the active job limit.
+        """
+        with self._backend.lock(f"user_jobs:{user}"):
+            job_ids = self._backend.get_json(f"user_jobs:{user}") or []
+            active = [job for job in map(self.get, job_ids) if job and job["status"] in ACTIVE_STATUSES]
+            if dedup_key is not None:
+                for existing in active:
+                    if existing["dedup_key"] == dedup_key:
+                        return existing["id"]
+            if len(active) >= self.max_jobs_per_user:
+                raise JobLimitError(
+                    f"You already have {len(active)} research job(s) running. Wait for one to finish or cancel it."
+                )
+
+            job = Job(self, uuid.uuid4().hex, user)
+            now = time.time()
+            self._save({
+                "id": job.id, "user": user, "title": title, "dedup_key": dedup_key, "status": "queued",
+                "result": None, "error": None, "created_at": now, "updated_at": now,
+                "replica": REPLICA_ID, "heartbeat_at": now,
+            })
+            self._backend.set_json(f"user_jobs:{user}", [job.id] + job_ids[:JOBS_KEPT_PER_USER - 1], JOB_RETENTION_SECONDS)
+            with self._lock:
+                self._jobs[job.id] = job
+
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def cancel(self, job_id):
+        """Requests cancellation. Queued jobs never start; running jobs stop at their next check."""
+        self._update(job_id, status="cancelling")
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel_event.set()
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if it does not exist."""
+        job = self._backend.get_json(f"job:{job_id}")
+        if job and job["status"] in ACTIVE_STATUSES and time.time() - job["heartbeat_at"] > JOB_STALE_SECONDS:
+            # The replica running it stopped
+            job["status"] = "interrupted"
+        return job
+
+    def list_jobs(self, user, limit=10):
+        """Returns the user's most recent jobs, newest first."""
+        job_ids = self._backend.get_json(f"user_jobs:{user}") or []
+        return [job for job in map(self.get, job_ids[:limit]) if job]
+
+    def events(self, job_id, limit=50):
+        """Returns the job's most recent progress events as (level, message) tuples, oldest first."""
+        events = self._backend.get_json(f"job_events:{job_id}") or []
+        return [tuple(event) for event in events[-limit:]]
+
+    def _save(self, job):
+        self._backend.set_json(f"job:{job['id']}", job, JOB_RETENTION_SECONDS)
+
+    def _update(self, job_id, status=None, **fields):
+        """Updates a job record under its lock. Returns the updated record, or None if it is gone."""
+        with self._backend.lock(f"job:{job_id}"):
+            job = self._backend.get_json(f"job:{job_id}")
+            if job is None:
+                return None
+            if status == "cancelling" and job["status"] not in ("queued", "running"):
+                return job
+            if status == "running" and job["status"] == "cancelling":
+                # Cancelled from another replica before the job started
+                status = None
+            if status:
+                job["status"] = status
+            job.update(fields, updated_at=time.time(), heartbeat_at=time.time())
+            self._save(job)
+            return job
+
+    def _add_event(self, job_id, level, message):
+        # Only the replica running a job writes its events, so a local lock is enough
+        with self._events_lock:
+            events = self._backend.get_json(f"job_events:{job_id}") or []
+            events.append([level, message])
+            self._backend.set_json(f"job_events:{job_id}", events[-EVENTS_KEPT_PER_JOB:], JOB_RETENTION_SECONDS)
+
+    def _set_status(self, job_id, status, result=None, error=None):
+        self._update(job_id, status=status, result=result, error=error)
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._lock:
+                local_jobs = list(self._jobs.values())
+            for job in local_jobs:
+                try:
+                    record = self._update(job.id)
+                except state.LockTimeout:
+                    continue
+                if record and record["status"] == "cancelling":
+                    job.cancel_event.set()
+
+    def _run(self, job, fn, args, kwargs):
+        try:
+            record = self._update(job.id)
+            if job.is_cancelled() or (record and record["status"] == "cancelling"):
+                self._set_status(job.id, "cancelled")
+                return
+            self._set_status(job.id, "running")
+            result = fn(job, *args, **kwargs)
+            self._set_status(job.id, "cancelled" if job.is_cancelled() else "done", result=result)
+        except JobCancelled:
+            self._set_status(job.id, "cancelled")
+        except Exception as e:
+            job.progress(f"Job failed: {e}", level="error")
+            self._set_status(job.id, "failed", error=str(e))
+        finally:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Returns the process-wide job queue, creating it on first use."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+
+def research_and_save(job, company_name, credentials=None, force_refresh=False):
+    """
+    Job function for a single company: Gemini research, article extraction and Drive upload.
+    Returns a dict with the Drive link and what was found.
+    """
+    with tracing.trace_run(f"research {company_name}"):
+        return _research_and_save(job, company_name, credentials, force_refresh)
+
+
+def _research(job, company_name, force_refresh):
+    """Runs (or loads cached) Gemini research, reporting partial failures. Raises if all parts failed."""
+    job.progress(f"Starting research for {company_name}...")
+    research_results = cache.cached_research_company(company_name, force_refresh=force_refresh, report=job.progress)
+    research_errors = research_results.get("errors", {})
+    if len(research_errors) >= 3:
+        raise RuntimeError("Gemini research failed. Please try again.")
+    if research_errors:
+        job.progress(f"Gemini research partially complete ({', '.join(research_errors)} failed).", level="warning")
+    else:
+        job.progress("Gemini research complete!", level="success")
+    job.check_cancelled()
+    return research_results
+
+
+def _research_and_save(job, company_name, credentials, force_refresh):
+    research_results = _research(job, company_name, force_refresh)
+
+    article_urls = [article['url'] for article in research_results.get('articles', []) if article.get('url')]
+    extracted_articles = []
+    if article_urls:
+        job.progress(f"Extracting content from {len(article_urls)} articles...")
+        extracted_articles, extraction_messages = cache.cached_extract_content_from_urls(article_urls, force_refresh=force_refresh)
+        for level, message in extraction_messages:
+            job.progress(message, level=level)
+        job.progress(f"Extracted content from {len(extracted_articles)} articles.")
+    else:
+        job.progress("No articles found by Gemini research.", level="warning")
+    job.check_cancelled()
+
+    job.progress("Saving results to Google Drive...")
+    drive_link = gdrive.save_research_to_drive(credentials, company_name, research_results, extracted_articles, report=job.progress)
+    if not drive_link:
+        raise RuntimeError("Failed to save to Google Drive.")
+    job.progress("Research complete! Files saved to Google Drive.", level="success")
+    return {"drive_link": drive_link, "article_count": len(extracted_articles)}
+
+
+def refresh_and_save(job, company_name, credentials=None, force_refresh=False):
+    """
+    Job function for an incremental refresh: updates the company's latest Drive folder
+    with what changed, fetching only articles its manifest doesn't have. Falls back to a
+    full research_and_save when there is no earlier folder with a manifest.
+    """
+    with tracing.trace_run(f"refresh {company_name}"):
+        return _refresh_and_save(job, company_name, credentials, force_refresh)
+
+
+def _refresh_and_save(job, company_name, credentials, force_refresh):
+    job.progress(f"Looking for earlier research on {company_name} in Google Drive...")
+    previous = gdrive.find_previous_research(credentials, company_name, report=job.progress)
+    if previous is None:
+        job.progress("No earlier research with a manifest found; running a full research instead.", level="warning")
+        return _research_and_save(job, company_name, credentials, force_refresh)
+    job.progress(f"Refreshing '{previous['folder_name']}' (last updated {previous['manifest'].get('generated_at')}).")
+    job.check_cancelled()
+
+    research_results = _research(job, company_name, force_refresh)
+
+    new_urls = gdrive.new_article_urls(previous['manifest'], research_results)
+    extracted_articles = []
+    if new_urls:
+        job.progress(f"Extracting content from {len(new_urls)} new articles...")
+        extracted_articles, extraction_messages = cache.cached_extract_content_from_urls(new_urls, force_refresh=force_refresh)
+        for level, message in extraction_messages:
+            job.progress(message, level=level)
+        job.progress(f"Extracted content from {len(extracted_articles)} new articles.")
+    else:
+        job.progress("No new articles since the last run.")
+    job.check_cancelled()
+
+    job.progress("Updating Google Drive...")
+    changes = gdrive.refresh_research_in_drive(
+        credentials, previous, company_name, research_results, extracted_articles, report=job.progress
+    )
+    if not changes:
+        raise RuntimeError("Failed to update Google Drive.")
+    job.progress(f"Refresh complete! {changes['summary']}.", level="success")
+    return {"drive_link": changes['drive_link'], "article_count": len(extracted_articles), "summary": changes['summary']}
+
+
+def save_to_drive(job, company_name, research_results, extracted_articles, credentials):
+    """Job function that uploads already gathered research to Drive (used by streaming mode)."""
+    job.progress("Saving results to Google Drive...")
+    drive_link = gdrive.save_research_to_drive(credentials, company_name, research_results, extracted_articles, report=job.progress)
+    if not drive_link:
+        raise RuntimeError("Failed to save to Google Drive.")
+    job.progress("Research complete! Files saved to Google Drive.", level="success")
+    return {"drive_link": drive_link, "article_count": len(extracted_articles)}
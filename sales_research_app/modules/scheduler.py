@@ -0,0 +1,285 @@
+"""
+Shared retry and rate-limit scheduler for calls to external services.
+
+Every call goes through call(backend, fn, ...), which:
+- waits for a token from the backend's token bucket (its sustained request rate),
+- holds a slot of the process-wide concurrency budget while fn runs,
+- retries transient failures (429, 5xx, connection errors) with exponential backoff
+  and full jitter, honoring Retry-After, which also pauses the whole backend,
+- with a breaker_key (the article host), fails fast while that key's circuit is open,
+- with a slot (e.g. a per-host semaphore), holds it for each attempt. The slot is taken
+  before the budget, so calls queued behind a busy host don't hold budget slots.
+"""
+import os
+import time
+import random
+import threading
+from collections import Counter
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+
+import requests
+from googleapiclient.errors import HttpError
+
+from modules import tracing
+
+MAX_IN_FLIGHT = int(os.getenv("SCHEDULER_MAX_IN_FLIGHT", "32"))
+BASE_DELAY_SECONDS = float(os.getenv("SCHEDULER_BASE_DELAY", "1"))
+MAX_DELAY_SECONDS = float(os.getenv("SCHEDULER_MAX_DELAY", "30"))
+BREAKER_FAILURES = int(os.getenv("SCHEDULER_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("SCHEDULER_BREAKER_RESET", "60"))
+
+# Per-backend settings: requests per second (0 = unlimited), burst size and attempts per call
+BACKENDS = {
+    "gemini": {
+        "rate": float(os.getenv("SCHEDULER_GEMINI_RATE", "2")),
+        "burst": int(os.getenv("SCHEDULER_GEMINI_BURST", "5")),
+        "max_attempts": int(os.getenv("SCHEDULER_GEMINI_ATTEMPTS", "4")),
+    },
+    "drive": {
+        "rate": float(os.getenv("SCHEDULER_DRIVE_RATE", "10")),
+        "burst": int(os.getenv("SCHEDULER_DRIVE_BURST", "20")),
+        "max_attempts": int(os.getenv("SCHEDULER_DRIVE_ATTEMPTS", "5")),
+    },
+    "articles": {
+        "rate": float(os.getenv("SCHEDULER_ARTICLES_RATE", "20")),
+        "burst": int(os.getenv("SCHEDULER_ARTICLES_BURST", "20")),
+        "max_attempts": int(os.getenv("SCHEDULER_ARTICLES_ATTEMPTS", "3")),
+    },
+}
+
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class TransientError(Exception):
+    """Raised by callers for a response worth retrying, with the server's Retry-After if it sent one."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+def parse_retry_after(value):
+    """Returns a Retry-After header (seconds or HTTP date) as seconds from now, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(error):
+    """Returns (retryable, retry_after seconds or None) for an exception raised by a call."""
+    if isinstance(error, TransientError):
+        return True, error.retry_after
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        # Drive reports per-user rate limits as 403 with a rateLimitExceeded reason
+        content = error.content or b""
+        rate_limited = status == 403 and (b"rateLimitExceeded" in content or b"userRateLimitExceeded" in content)
+        return status in RETRYABLE_STATUSES or rate_limited, parse_retry_after(error.resp.get("retry-after"))
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, TimeoutError)):
+        return True, None
+    # google.api_core exceptions (raised by the Gemini client) carry the HTTP status as .code
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and type(error).__module__.startswith("google.api_core"):
+        return code in RETRYABLE_STATUSES, None
+    return False, None
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available. Returns the seconds spent waiting."""
+        if self.rate <= 0 and not self._paused_until:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.rate > 0:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                elif self.rate <= 0:
+                    return waited
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                else:
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """Stops handing out tokens for `seconds` (used when the backend sends Retry-After)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and rejects calls
+    for `reset_seconds`. Then one trial call is let through: success closes the
+    circuit, another failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_seconds and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+
+class Scheduler:
+    """Applies rate limits, the concurrency budget, retries and circuit breakers to calls."""
+
+    def __init__(self, backends=None, max_in_flight=MAX_IN_FLIGHT, base_delay=BASE_DELAY_SECONDS,
+                 max_delay=MAX_DELAY_SECONDS, breaker_failures=BREAKER_FAILURES, breaker_reset=BREAKER_RESET_SECONDS):
+        self.backends = backends or BACKENDS
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self._budget = threading.BoundedSemaphore(max_in_flight)
+        self._buckets = {name: TokenBucket(cfg["rate"], cfg["burst"]) for name, cfg in self.backends.items()}
+        self._breakers = {}
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def breaker(self, backend, key):
+        """Returns the circuit breaker for (backend, key), creating it on first use."""
+        with self._lock:
+            breaker = self._breakers.get((backend, key))
+            if breaker is None:
+                breaker = self._breakers[(backend, key)] = CircuitBreaker(self.breaker_failures, self.breaker_reset)
+            return breaker
+
+    def stats(self):
+        """Returns {backend: {"calls", "retries", "failures", "circuit_open"}} counts since startup."""
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            backend: {kind: counts.get((backend, kind), 0) for kind in ("calls", "retries", "failures", "circuit_open")}
+            for backend in self.backends
+        }
+
+    def _count(self, backend, kind):
+        with self._lock:
+            self._counts[(backend, kind)] += 1
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Returns the delay before retry number `attempt`: Retry-After if given, else capped exponential with full jitter."""
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def call(self, backend, fn, *args, breaker_key=None, deadline=None, slot=None, **kwargs):
+        """
+        Calls fn(*args, **kwargs) under the backend's rate limit and the concurrency budget,
+        retrying transient failures. `deadline` (a time.monotonic() value) stops retries that
+        could not start in time. `slot` (a semaphore or other context manager) is held for
+        each attempt, and released during backoff. Raises the last error once attempts run
+        out, and CircuitOpenError when breaker_key's circuit is open.
+        """
+        bucket = self._buckets[backend]
+        max_attempts = self.backends[backend]["max_attempts"]
+        breaker = self.breaker(backend, breaker_key) if breaker_key is not None else None
+
+        self._count(backend, "calls")
+        attempt = 0
+        while True:
+            attempt += 1
+            if breaker and not breaker.allow():
+                self._count(backend, "circuit_open")
+                raise CircuitOpenError(f"{breaker_key} is failing repeatedly; skipping it for now")
+            try:
+                with slot or nullcontext():
+                    bucket.acquire()
+                    with self._budget:
+                        result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable, retry_after = classify(e)
+                if breaker:
+                    # Only outages count against the host; a 404 says nothing about its health
+                    breaker.record_failure() if retryable else breaker.record_success()
+                delay = self.backoff_delay(attempt, retry_after)
+                if (not retryable or attempt >= max_attempts or delay > self.max_delay
+                        or (deadline is not None and time.monotonic() + delay >= deadline)):
+                    self._count(backend, "failures")
+                    raise
+                self._count(backend, "retries")
+                if retry_after:
+                    bucket.pause(retry_after)
+                with tracing.span("scheduler.backoff", labels={"backend": backend}, attempt=attempt, error=str(e)):
+                    time.sleep(delay)
+                continue
+            if breaker:
+                breaker.record_success()
+            return result
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Returns the process-wide scheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
+
+
+def call(backend, fn, *args, breaker_key=None, deadline=None, slot=None, **kwargs):
+    """Runs fn through the process-wide scheduler (see Scheduler.call)."""
+    return get_scheduler().call(backend, fn, *args, breaker_key=breaker_key, deadline=deadline, slot=slot, **kwargs)
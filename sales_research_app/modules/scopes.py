@@ -0,0 +1,11 @@
+"""
+OAuth scopes the app asks for. Kept apart from modules.auth, which imports Streamlit, so
+headless entry points (batch_cli.py) can load credentials without it.
+"""
+
+SCOPES = [
+    'https://www.googleapis.com/auth/drive.file',
+    'openid',
+    'https://www.googleapis.com/auth/userinfo.email',
+    'https://www.googleapis.com/auth/userinfo.profile'
+]
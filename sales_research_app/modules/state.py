@@ -0,0 +1,294 @@
+"""
+Shared state for running several app replicas: sign-in sessions, OAuth state and
+background job state live in a backend every replica can reach, instead of in one
+process's st.session_state.
+
+STATE_BACKEND_URL selects the backend:
+- sqlite:///path/to/state.sqlite3 (default data/state.sqlite3): a local file, shared by
+  replicas that mount the same volume on one host,
+- redis://host:6379/0: any Redis-compatible server (needs the `redis` package).
+
+Secrets (credentials) are encrypted with Fernet using STATE_ENCRYPTION_KEY. Without it, a
+key is generated once into STATE_KEY_PATH; replicas must share that file or the variable.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from cryptography.fernet import Fernet, InvalidToken
+
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL", "sqlite:///" + os.path.join("data", "state.sqlite3"))
+STATE_ENCRYPTION_KEY = os.getenv("STATE_ENCRYPTION_KEY")
+STATE_KEY_PATH = os.getenv("STATE_KEY_PATH", os.path.join("data", "state.key"))
+# Each SQLite backend deletes expired rows once every this many writes
+PURGE_EVERY = 500
+
+
+class LockTimeout(Exception):
+    """Raised when a state lock could not be acquired in time."""
+
+
+class StateBackend:
+    """
+    Key-value store with expiry. Backends implement get, set, set_if_absent, pop, delete
+    and delete_if_equals on bytes values; JSON, encryption and locks are built on top of those.
+    pop and delete_if_equals must be atomic, since several replicas may race on one key.
+    """
+
+    def get(self, key):
+        """Returns the value for key as bytes, or None if it is missing or expired."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """Stores bytes under key, expiring after ttl seconds if given."""
+        raise NotImplementedError
+
+    def set_if_absent(self, key, value, ttl=None):
+        """Stores the value only if key is missing or expired. Returns True if it was stored."""
+        raise NotImplementedError
+
+    def pop(self, key):
+        """Deletes key and returns the value it held, or None. Only one caller gets the value."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def delete_if_equals(self, key, value):
+        """Deletes key only while it still holds value (used to release locks)."""
+        raise NotImplementedError
+
+    def get_json(self, key):
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key, value, ttl=None):
+        self.set(key, json.dumps(value).encode(), ttl)
+
+    @contextmanager
+    def lock(self, name, ttl=30, timeout=30):
+        """
+        Holds a lock shared by every replica using this backend. The lock expires after
+        ttl seconds in case its holder dies. Raises LockTimeout after waiting `timeout` seconds.
+        """
+        key = f"lock:{name}"
+        token = uuid.uuid4().hex.encode()
+        deadline = time.monotonic() + timeout
+        while not self.set_if_absent(key, token, ttl):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"Timed out waiting for lock {name}")
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            self.delete_if_equals(key, token)
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    State in a SQLite file. Safe across processes on one host (e.g. replicas sharing a volume).
+    Expired rows are purged every `purge_every` writes, so finished jobs, abandoned sign-ins
+    and old sessions don't pile up in the file.
+    """
+
+    def __init__(self, path, purge_every=PURGE_EVERY):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._purge_every = purge_every
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS state_expires_at ON state (expires_at)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None)
+            )
+            self._writes += 1
+            if self._writes % self._purge_every == 0:
+                self._conn.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+
+    def set_if_absent(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock, so other processes can't interleave
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM state WHERE key = ? AND expires_at <= ?", (key, now))
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, now + ttl if ttl else None)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+
+    def pop(self, key):
+        now = time.time()
+        with self._lock:
+            # A single statement, so two processes can't both read the row before it is deleted
+            row = self._conn.execute(
+                "DELETE FROM state WHERE key = ? RETURNING value, expires_at", (key,)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return bytes(row[0])
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def delete_if_equals(self, key, value):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE key = ? AND value = ?", (key, value))
+
+
+class RedisStateBackend(StateBackend):
+    """
+    State in Redis (or anything speaking its API). `client` only needs the redis-py
+    methods get, set (with ex and nx), getdel, delete and eval (for DELETE_IF_EQUALS_SCRIPT),
+    so tests can pass an in-memory stand-in. GETDEL needs Redis 6.2 or later.
+    """
+
+    # Compare-and-delete in one step on the server, so a lock that expired and was taken
+    # by another replica in between is never released by its previous holder
+    DELETE_IF_EQUALS_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, client, prefix="sales-research:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    def set_if_absent(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, value, ex=int(ttl) if ttl else None, nx=True))
+
+    def pop(self, key):
+        return self.client.getdel(self.prefix + key)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def delete_if_equals(self, key, value):
+        self.client.eval(self.DELETE_IF_EQUALS_SCRIPT, 1, self.prefix + key, value)
+
+
+def create_backend(url=STATE_BACKEND_URL):
+    """Returns the backend for a STATE_BACKEND_URL."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("STATE_BACKEND_URL points at Redis, but the 'redis' package is not installed.")
+        return RedisStateBackend(redis.Redis.from_url(url))
+    if url.startswith("sqlite:///"):
+        return SQLiteStateBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported STATE_BACKEND_URL: {url}")
+
+
+def _load_encryption_key(path=STATE_KEY_PATH):
+    """Returns STATE_ENCRYPTION_KEY, or the key in `path`, generating it there on first use."""
+    if STATE_ENCRYPTION_KEY:
+        return STATE_ENCRYPTION_KEY.encode()
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        # The key is written to a temporary file and linked into place, so a replica starting
+        # at the same moment never reads a half-written file. os.link fails if the path exists,
+        # so only one replica's key wins and every replica reads that one
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(Fernet.generate_key())
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, "rb") as f:
+        return f.read().strip()
+
+
+class SecretBox:
+    """Encrypts JSON values stored in a backend."""
+
+    def __init__(self, backend, key):
+        self.backend = backend
+        self._fernet = Fernet(key)
+
+    def get(self, key):
+        """Returns the decrypted value, or None if it is missing or can't be decrypted (e.g. after a key change)."""
+        token = self.backend.get(key)
+        if token is None:
+            return None
+        try:
+            return json.loads(self._fernet.decrypt(token))
+        except InvalidToken:
+            return None
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, self._fernet.encrypt(json.dumps(value).encode()), ttl)
+
+    def pop(self, key):
+        """Returns and deletes a value, so it can only be used once (even across replicas)."""
+        token = self.backend.pop(key)
+        if token is None:
+            return None
+        try:
+            return json.loads(self._fernet.decrypt(token))
+        except InvalidToken:
+            return None
+
+
+_backend = None
+_secrets = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Returns the process-wide state backend, creating it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
+
+
+def get_secrets():
+    """Returns the process-wide encrypted view of the state backend."""
+    global _secrets
+    backend = get_backend()
+    with _backend_lock:
+        if _secrets is None:
+            _secrets = SecretBox(backend, _load_encryption_key())
+        return _secrets
@@ -0,0 +1,262 @@
+"""
+Lightweight span tracing for the research pipeline.
+
+Spans record a duration, byte count and outcome. They feed Prometheus-format
+metrics served on METRICS_HOST:METRICS_PORT (localhost by default) and, inside trace_run(), a JSON trace file per
+run in TRACE_DIR. With TRACING_ENABLED unset, span() returns a shared no-op
+object and nothing is recorded.
+"""
+import os
+import re
+import json
+import time
+import threading
+import contextvars
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "").lower() in ("1", "true", "yes")
+# Bind address of /metrics; set it to 0.0.0.0 to let a scraper on another host reach it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+TRACE_DIR = os.getenv("TRACE_DIR")
+
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_run = contextvars.ContextVar("trace_run", default=None)
+
+
+class _Metrics:
+    """Thread-safe histogram and counters keyed by (span name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations = {} # key -> [bucket counts..., sum, count]
+        self._bytes = {}
+
+    def observe(self, name, labels, duration, byte_count):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._durations.get(key)
+            if series is None:
+                series = self._durations[key] = [0] * len(DURATION_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    series[i] += 1
+            series[-2] += duration
+            series[-1] += 1
+            if byte_count:
+                self._bytes[key] = self._bytes.get(key, 0) + byte_count
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        def label_text(key, extra=()):
+            pairs = [("span", key[0])] + list(key[1]) + list(extra)
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        with self._lock:
+            durations = {key: list(series) for key, series in self._durations.items()}
+            byte_totals = dict(self._bytes)
+
+        lines = [
+            "# HELP research_span_duration_seconds Duration of research pipeline spans.",
+            "# TYPE research_span_duration_seconds histogram",
+        ]
+        for key, series in sorted(durations.items()):
+            for i, bound in enumerate(DURATION_BUCKETS):
+                lines.append(f"research_span_duration_seconds_bucket{label_text(key, [('le', bound)])} {series[i]}")
+            lines.append(f"research_span_duration_seconds_bucket{label_text(key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"research_span_duration_seconds_sum{label_text(key)} {series[-2]}")
+            lines.append(f"research_span_duration_seconds_count{label_text(key)} {series[-1]}")
+        lines += [
+            "# HELP research_span_bytes_total Bytes transferred by research pipeline spans.",
+            "# TYPE research_span_bytes_total counter",
+        ]
+        for key, total in sorted(byte_totals.items()):
+            lines.append(f"research_span_bytes_total{label_text(key)} {total}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+metrics = _Metrics()
+
+
+class _NoopSpan:
+    """Returned by span() when tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add_bytes(self, count):
+        pass
+
+    def set_outcome(self, outcome):
+        pass
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    A timed operation. `labels` become metric labels (keep them low-cardinality);
+    `attributes` only appear in the JSON trace. The outcome defaults to "ok", or
+    "error" when the block raises.
+    """
+
+    def __init__(self, name, labels=None, attributes=None):
+        self.name = name
+        self.labels = labels or {}
+        self.attributes = attributes or {}
+        self.byte_count = 0
+        self.outcome = None
+
+    def __enter__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        if self.outcome is None:
+            self.outcome = "error" if exc_type else "ok"
+        if exc_type:
+            self.attributes.setdefault("error", f"{exc_type.__name__}: {exc}")
+        metrics.observe(self.name, dict(self.labels, outcome=self.outcome), duration, self.byte_count)
+
+        run = _current_run.get()
+        if run is not None:
+            run.add({
+                "name": self.name,
+                "start": self.started_at,
+                "duration": duration,
+                "bytes": self.byte_count,
+                "outcome": self.outcome,
+                "thread": threading.current_thread().name,
+                "labels": self.labels,
+                "attributes": self.attributes,
+            })
+        return False
+
+    def add_bytes(self, count):
+        self.byte_count += count or 0
+
+    def set_outcome(self, outcome):
+        self.outcome = outcome
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+def span(name, labels=None, **attributes):
+    """Returns a context manager timing the block as a span (a shared no-op when tracing is disabled)."""
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, labels, attributes)
+
+
+def bind(fn):
+    """
+    Wraps fn so calls on pool threads record spans into the caller's trace_run.
+    Returns fn unchanged when tracing is disabled.
+    """
+    if not TRACING_ENABLED:
+        return fn
+    context = contextvars.copy_context()
+
+    def run_in_context(*args, **kwargs):
+        # Each call gets its own copy: a Context can't be entered by two threads at once
+        return context.copy().run(fn, *args, **kwargs)
+    return run_in_context
+
+
+class _Run:
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span_record):
+        with self._lock:
+            self.spans.append(span_record)
+
+
+class trace_run:
+    """
+    Context manager collecting every span recorded during a run (including on pool
+    threads using bind()) and writing them to a JSON file in TRACE_DIR on exit.
+    Does nothing unless tracing is enabled and TRACE_DIR is set.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.path = None
+        self._run = None
+        self._token = None
+
+    def __enter__(self):
+        if TRACING_ENABLED and TRACE_DIR:
+            self._run = _Run(self.name)
+            self._token = _current_run.set(self._run)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._run is None:
+            return False
+        _current_run.reset(self._token)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.name)[:80]
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        self.path = os.path.join(TRACE_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{slug}.json")
+        with open(self.path, "w") as f:
+            json.dump({
+                "run": self.name,
+                "started_at": self._run.started_at,
+                "duration": time.time() - self._run.started_at,
+                "outcome": "error" if exc_type else "ok",
+                "spans": sorted(self._run.spans, key=lambda s: s["start"]),
+            }, f, indent=2)
+        return False
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serves /metrics on host:port from a daemon thread (once per process, only when tracing is enabled)."""
+    global _metrics_server
+    if not TRACING_ENABLED:
+        return None
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _metrics_server.daemon_threads = True
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+        return _metrics_server
@@ -0,0 +1,93 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, unquote_plus
+
+# Query parameters that only track the click and never change the page content.
+# Names are matched exactly (lowercased), apart from the utm_ family
+_TRACKING_PARAMS = frozenset(("gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src", "ref_url", "cmpid"))
+_TRACKING_PREFIX = "utm_"
+# Characters models leave behind URLs ("<https://...>.", "(https://...).", "**https://...**").
+# A closing parenthesis is only one of them when the URL has no matching "(" (see _trim_url)
+_URL_TRAILING_CHARS = "<>[]'\"`*.,;:!?"
+_URL_PATTERN = re.compile(r"https?://[^\s<>\"'`\]]+", re.IGNORECASE)
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in _TRACKING_PARAMS or name.startswith(_TRACKING_PREFIX)
+
+
+def strip_tracking_params(url):
+    """
+    Removes tracking parameters from a URL, leaving everything else (order, case, encoding,
+    path) as it was. The URL is returned untouched when it has no tracking parameters.
+    """
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    pieces = parts.query.split("&")
+    # The raw pieces are kept, so "?print" or "?q=a%20b" aren't re-encoded
+    kept = [piece for piece in pieces if not _is_tracking_param(unquote_plus(piece.partition("=")[0]))]
+    if len(kept) == len(pieces):
+        return url
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "&".join(kept), parts.fragment))
+
+
+def _trim_url(url):
+    """Strips trailing punctuation from a matched URL, keeping a ")" that closes a "(" in it."""
+    while url:
+        last = url[-1]
+        if last in _URL_TRAILING_CHARS or (last == ")" and url.count(")") > url.count("(")):
+            url = url[:-1]
+        else:
+            break
+    return url
+
+
+def normalize_url(url):
+    """
+    Normalizes a URL for use as a key: lowercases scheme and host, drops default
+    ports, fragments and tracking parameters, sorts the query and trims the trailing slash.
+    """
+    parts = urlsplit((url or "").strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(k)
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, netloc, path, urlencode(query), ""))
+
+
+def clean_url(text):
+    """
+    Extracts a fetchable http(s) URL from model output such as "<https://x.com/a>." or
+    "[title](https://x.com/a)" and returns it without tracking parameters, or None if
+    there is none. The URL is otherwise left as the model gave it; use normalize_url for keys.
+    """
+    match = _URL_PATTERN.search(text or "")
+    if not match:
+        return None
+    url = _trim_url(match.group(0))
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https") or "." not in parts.netloc:
+        return None
+    return strip_tracking_params(url)
+
+
+def dedupe_articles(articles):
+    """
+    Cleans each article's URL and drops articles without a usable URL or whose
+    normalized URL was already seen, keeping the first occurrence.
+    """
+    seen = set()
+    unique = []
+    for article in articles:
+        url = clean_url(article.get("url"))
+        key = normalize_url(url) if url else None
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(dict(article, url=url))
+    return unique
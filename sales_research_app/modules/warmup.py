@@ -0,0 +1,80 @@
+"""
+Process warm-up: loads the heavy dependencies and process-wide resources the
+research path needs, so the first signed-in user doesn't wait for them.
+"""
+import os
+import time
+import logging
+import threading
+
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+_started = False
+_started_lock = threading.Lock()
+
+
+def warm_up():
+    """
+    Imports the research modules and builds their singletons: Gemini model client,
+    discovery documents, cache and article store databases, job queue and parse pool.
+    Returns {step: seconds}. Failing steps are logged and skipped.
+    """
+    timings = {}
+
+    def step(name, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+        timings[name] = time.perf_counter() - started
+
+    def import_modules():
+        from modules import gemini, cache, jobs, batch, gdrive, extractor, article_store  # noqa: F401
+        # Used for the token exchange when the user comes back from Google
+        from google_auth_oauthlib.flow import Flow  # noqa: F401
+
+    def load_discovery_documents():
+        from modules import clients
+        clients.get_discovery_document("drive", "v3")
+        clients.get_discovery_document("oauth2", "v2")
+
+    def open_stores():
+        from modules import cache, article_store
+        cache.get_cache()
+        article_store.get_store()
+
+    def start_job_queue():
+        from modules import jobs
+        jobs.get_job_queue()
+
+    def start_parse_pool():
+        from modules import extractor
+        extractor.warm_parse_pool()
+
+    def create_gemini_model():
+        from modules import gemini
+        gemini.get_model()
+
+    step("imports", import_modules)
+    step("discovery_documents", load_discovery_documents)
+    step("stores", open_stores)
+    step("job_queue", start_job_queue)
+    step("gemini_model", create_gemini_model)
+    step("parse_pool", start_parse_pool)
+    logger.info("Warm-up finished: %s", {name: round(seconds, 3) for name, seconds in timings.items()})
+    return timings
+
+
+def start():
+    """Runs warm_up() on a daemon thread, once per process. Does nothing if WARMUP_ON_START is off."""
+    global _started
+    if not WARMUP_ON_START:
+        return
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
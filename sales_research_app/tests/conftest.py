@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+# The app imports its modules as `modules.*` and the fakes as `benchmarks.*` from the app directory
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+from benchmarks import fakes  # noqa: E402
+from modules import article_store, cache, clients, gemini, state  # noqa: E402
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend(request, tmp_path):
+    """Each state backend: SQLite in a temporary file, and Redis through FakeRedis."""
+    if request.param == "sqlite":
+        return state.SQLiteStateBackend(str(tmp_path / "state.sqlite3"))
+    return state.RedisStateBackend(fakes.FakeRedis())
+
+
+@pytest.fixture(scope="session")
+def drive_server():
+    """
+    One fake Drive for the whole run: discovery documents are cached per process with the
+    root URL set here, so a second server would leave them pointing at a closed port.
+    """
+    server = fakes.start_drive_server(latency=0)
+    clients.API_ROOT_URLS["drive"] = server.base_url + "/"
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def article_server():
+    server = fakes.start_article_server(slow_delay=0.1, huge_bytes=1024 * 1024)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def gemini_model(article_server, monkeypatch):
+    """The shared Gemini client replaced by the fake, always answering with the 'clean' recording."""
+    model = fakes.FakeGeminiModel(
+        article_server.base_url, responses=fakes.load_gemini_responses(["clean"]), latency=0, jitter=0
+    )
+    monkeypatch.setattr(gemini, "_model", model)
+    return model
+
+
+@pytest.fixture
+def research_cache(tmp_path, monkeypatch):
+    research_cache = cache.ResearchCache(str(tmp_path / "research_cache.sqlite3"))
+    monkeypatch.setattr(cache, "_cache", research_cache)
+    return research_cache
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = article_store.ArticleStore(str(tmp_path / "articles.sqlite3"))
+    monkeypatch.setattr(article_store, "_store", store)
+    return store
@@ -0,0 +1,80 @@
+import itertools
+import os
+
+import pytest
+
+from modules import article_store, cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A time.time that moves forward a second per call, so access order is never a tie."""
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(article_store.time, "time", lambda: float(next(ticks)))
+
+
+def test_same_content_is_stored_once(store):
+    digest = store.put("https://a.example/story", "Same story")
+    assert store.put("https://b.example/syndicated?utm_source=feed", "Same story") == digest
+    assert store.stats()["urls"] == 2
+    assert store.stats()["blobs"] == 1
+    # URLs are looked up normalized
+    assert store.get("https://B.example/syndicated")["markdown_content"] == "Same story"
+
+
+def test_changed_page_drops_its_old_content(store):
+    store.put("https://a.example/story", "First version")
+    store.put("https://b.example/story", "Shared")
+    store.put("https://a.example/story", "Second version")
+    assert store.get("https://a.example/story")["markdown_content"] == "Second version"
+    assert store.stats()["blobs"] == 2
+    # Content another URL still points at is kept
+    store.put("https://a.example/story", "Shared")
+    store.put("https://a.example/story", "Third version")
+    assert store.get("https://b.example/story")["markdown_content"] == "Shared"
+
+
+def test_least_recently_used_content_is_evicted(tmp_path, clock):
+    contents = {name: os.urandom(1024).hex() for name in ("a", "b", "c")}
+    store = article_store.ArticleStore(str(tmp_path / "articles.sqlite3"))
+    store.put("https://x.example/a", contents["a"])
+    # Random text compresses about the same every time: room for two blobs, not three
+    store.max_bytes = store.stats()["bytes"] * 5 // 2
+    store.put("https://x.example/b", contents["b"])
+    store.get("https://x.example/a")
+    store.put("https://x.example/c", contents["c"])
+    assert store.get("https://x.example/b") is None
+    assert store.get("https://x.example/a")["markdown_content"] == contents["a"]
+    assert store.get("https://x.example/c")["markdown_content"] == contents["c"]
+    assert store.stats()["blobs"] == 2
+
+
+def test_drive_files(store):
+    digest = store.put("https://a.example/story", "Story")
+    assert store.get_drive_file("user-1", digest) is None
+    store.set_drive_file("user-1", digest, "file-1", "https://drive.example/file-1")
+    assert store.get_drive_file("user-1", digest) == ("file-1", "https://drive.example/file-1")
+    assert store.get_drive_file("user-2", digest) is None
+    store.forget_drive_file("user-1", digest)
+    assert store.get_drive_file("user-1", digest) is None
+
+
+def test_stale_articles_are_revalidated(article_server, store):
+    url = f"{article_server.base_url}/pages/article_4.html"
+    (article,), _ = cache.cached_extract_content_from_urls([url])
+    assert article["content_hash"] == article_store.content_hash(article["markdown_content"])
+    stored = {"url": url, "markdown_content": article["markdown_content"], "content_hash": article["content_hash"]}
+
+    # Fresh: served from the store without a request
+    requests_before = article_server.requests["pages"]
+    assert cache.cached_extract_content_from_urls([url])[0] == [stored]
+    assert article_server.requests["pages"] == requests_before
+    assert store.stats()["hits"] == 1
+
+    # Stale: a conditional GET answered with 304 reuses the stored content
+    store.fresh_seconds = 0
+    not_modified_before = article_server.requests["not_modified"]
+    assert cache.cached_extract_content_from_urls([url])[0] == [stored]
+    assert article_server.requests["not_modified"] == not_modified_before + 1
+    assert store.stats()["revalidated"] == 1
+    assert store.stats()["stored"] == 1
@@ -0,0 +1,71 @@
+import os
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from cryptography.fernet import Fernet
+from streamlit.testing.v1 import AppTest
+
+from modules import auth, state, warmup
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def secrets(tmp_path, monkeypatch):
+    backend = state.SQLiteStateBackend(str(tmp_path / "state.sqlite3"))
+    box = state.SecretBox(backend, Fernet.generate_key())
+    monkeypatch.setattr(state, "_backend", backend)
+    monkeypatch.setattr(state, "_secrets", box)
+    return box
+
+
+@pytest.fixture
+def sign_in_page(secrets, monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLIENT_ID", "test-client")
+    monkeypatch.setenv("GOOGLE_CLIENT_SECRET", "test-secret")
+    monkeypatch.setattr(warmup, "WARMUP_ON_START", False)
+    app = AppTest.from_file(os.path.join(APP_DIR, "app.py"), default_timeout=60)
+    app.run()
+    assert not app.exception
+    return app
+
+
+def pending_state(app):
+    return parse_qs(urlsplit(app.session_state["oauth_url"]).query)["state"][0]
+
+
+def test_authorization_url(sign_in_page):
+    query = parse_qs(urlsplit(sign_in_page.session_state["oauth_url"]).query)
+    assert query["client_id"] == ["test-client"]
+    assert query["code_challenge_method"] == ["S256"]
+    assert query["access_type"] == ["offline"]
+    assert query["scope"] == [" ".join(auth.SCOPES)]
+
+
+def test_pending_sign_in_is_bound_to_the_browser(sign_in_page, secrets):
+    nonce = sign_in_page.session_state["oauth_nonce"]
+    pending = secrets.get(f"oauth:{pending_state(sign_in_page)}")
+    assert pending["nonce"] == nonce
+    assert pending["redirect_uri"] == sign_in_page.session_state["redirect_uri"]
+    assert any(f"{auth.OAUTH_NONCE_COOKIE}={nonce}" in html.proto.body for html in sign_in_page.get("html"))
+
+
+@pytest.mark.parametrize("nonce", [None, "", "another-browser"])
+def test_callback_from_another_browser_is_rejected(sign_in_page, secrets, nonce):
+    oauth_state = pending_state(sign_in_page)
+    assert auth.fetch_tokens("code", oauth_state, nonce) is None
+    # The state is used up, so the link can't be retried either
+    assert secrets.get(f"oauth:{oauth_state}") is None
+
+
+def test_unknown_state_is_rejected(secrets):
+    assert auth.fetch_tokens("code", "unknown", "nonce") is None
+
+
+def test_reruns_reuse_the_url_until_it_gets_old(sign_in_page):
+    url = sign_in_page.session_state["oauth_url"]
+    sign_in_page.run()
+    assert sign_in_page.session_state["oauth_url"] == url
+    sign_in_page.session_state["oauth_url_created_at"] -= auth.OAUTH_URL_MAX_AGE_SECONDS
+    sign_in_page.run()
+    assert sign_in_page.session_state["oauth_url"] != url
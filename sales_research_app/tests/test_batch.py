@@ -0,0 +1,82 @@
+import io
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from modules import batch, gemini
+
+
+class FailingFor:
+    """Wraps a model so research prompts about one company fail without being retried."""
+
+    def __init__(self, model, company_name):
+        self.model = model
+        self.company_name = company_name
+
+    def generate_content(self, prompt, **kwargs):
+        if self.company_name in prompt:
+            raise ValueError("Request blocked")
+        return self.model.generate_content(prompt, **kwargs)
+
+
+@pytest.fixture
+def pipeline(drive_server, gemini_model, research_cache, store):
+    return gemini_model
+
+
+def run(companies, checkpoint_path):
+    events = []
+    state = batch.run_batch(
+        companies, Credentials(token="batch-token"), checkpoint_path=str(checkpoint_path),
+        progress_callback=lambda company, stage, status, detail: events.append((company, stage, status))
+    )
+    return state, events
+
+
+def test_read_companies_csv():
+    csv_file = b"\xef\xbb\xbfIndustry,Account Name\nSoftware,Acme\nRetail, acme \nRetail,\nLogistics,Globex\n"
+    assert batch.read_companies_csv(io.BytesIO(csv_file)) == ["Acme", "Globex"]
+    assert batch.read_companies_csv(io.StringIO("Acme\nGlobex\n")) == ["Acme", "Globex"]
+
+
+def test_companies_are_saved_and_checkpointed(pipeline, drive_server, tmp_path):
+    checkpoint_path = tmp_path / "batch.json"
+    state, events = run(["Batch Alpha", "Batch Beta"], checkpoint_path)
+
+    assert {key: entry["status"] for key, entry in state.items()} == {"batch alpha": "done", "batch beta": "done"}
+    assert batch.load_checkpoint(str(checkpoint_path)) == state
+    folders = {f["name"].rsplit("_", 2)[0]: f["id"] for f in drive_server.files.values() if f["name"].startswith("Batch ")}
+    for company in ("Batch Alpha", "Batch Beta"):
+        assert folders[company] in state[company.lower()]["drive_link"]
+        assert [stage for name, stage, status in events if name == company and status == "done"] == [
+            "research", "extract", "upload", "batch"
+        ]
+
+
+def test_resume_skips_completed_companies(pipeline, drive_server, tmp_path):
+    checkpoint_path = tmp_path / "batch.json"
+    run(["Batch Gamma"], checkpoint_path)
+    drive_requests = sum(drive_server.requests.values())
+
+    state, events = run(["Batch Gamma"], checkpoint_path)
+    assert events == [("Batch Gamma", "batch", "skipped")]
+    assert state["batch gamma"]["status"] == "done"
+    assert sum(drive_server.requests.values()) == drive_requests
+
+
+def test_failed_company_is_retried_on_resume(pipeline, monkeypatch, tmp_path):
+    checkpoint_path = tmp_path / "batch.json"
+    monkeypatch.setattr(gemini, "_model", FailingFor(pipeline, "Batch Broken"))
+    state, _ = run(["Batch Delta", "Batch Broken"], checkpoint_path)
+    assert state["batch delta"]["status"] == "done"
+    assert state["batch broken"]["status"] == "failed"
+    assert state["batch broken"]["stage"] == "research"
+    assert "Request blocked" in state["batch broken"]["error"]
+
+    # Once Gemini answers again, only the failed company is run
+    monkeypatch.setattr(gemini, "_model", pipeline)
+    state, events = run(["Batch Delta", "Batch Broken"], checkpoint_path)
+    assert ("Batch Delta", "batch", "skipped") in events
+    assert ("Batch Broken", "batch", "done") in events
+    assert state["batch broken"]["status"] == "done"
+    assert state["batch broken"]["error"] is None
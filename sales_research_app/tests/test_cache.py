@@ -0,0 +1,65 @@
+import itertools
+
+import pytest
+
+from benchmarks import fakes
+from modules import cache, gemini
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable time.time for the cache, starting at 1,000,000 and only moving when told to."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_normalize_company_name():
+    assert cache.normalize_company_name("  ACME,   Inc. ") == "acme, inc"
+    assert cache.normalize_company_name(None) == ""
+
+
+def test_entries_expire_after_their_namespace_ttl(tmp_path, clock):
+    research_cache = cache.ResearchCache(str(tmp_path / "cache.sqlite3"), ttls={"research": 60, "other": 600})
+    research_cache.set("research", "acme", {"overview": "Widgets"})
+    research_cache.set("other", "acme", [1, 2])
+    clock[0] += 60
+    assert research_cache.get("research", "acme") == {"overview": "Widgets"}
+    clock[0] += 1
+    assert research_cache.get("research", "acme") is None
+    assert research_cache.get("other", "acme") == [1, 2]
+    assert research_cache.stats() == {"hits": {"research": 1, "other": 1}, "misses": {"research": 1}, "entries": 1}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(cache.time, "time", lambda: float(next(ticks)))
+    research_cache = cache.ResearchCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    research_cache.set("research", "a", 1)
+    research_cache.set("research", "b", 2)
+    research_cache.get("research", "a")
+    research_cache.set("research", "c", 3)
+    assert research_cache.get("research", "b") is None
+    assert research_cache.get("research", "a") == 1
+    assert research_cache.get("research", "c") == 3
+
+
+def test_research_is_cached_by_normalized_name(gemini_model, research_cache):
+    results = cache.cached_research_company("Acme Corp")
+    assert results["errors"] == {}
+    assert cache.cached_research_company("  ACME corp. ") == results
+    assert gemini_model.calls["generate"] == 1
+    # force_refresh asks Gemini again
+    cache.cached_research_company("Acme Corp", force_refresh=True)
+    assert gemini_model.calls["generate"] == 2
+
+
+def test_partial_results_are_not_cached(article_server, research_cache, monkeypatch):
+    model = fakes.FakeGeminiModel(
+        article_server.base_url, responses=fakes.load_gemini_responses(["malformed"]), latency=0, jitter=0
+    )
+    monkeypatch.setattr(gemini, "_model", model)
+    assert cache.cached_research_company("Acme Corp")["errors"]
+    assert cache.cached_research_company("Acme Corp")["errors"]
+    assert model.calls["generate"] == 2
+    assert research_cache.stats()["entries"] == 0
@@ -0,0 +1,56 @@
+import pytest
+
+from modules import extractor, scheduler
+
+
+def test_fetch_page(article_server):
+    text, truncated, validators = extractor._fetch(f"{article_server.base_url}/pages/article_1.html")
+    assert "<html" in text.lower()
+    assert not truncated
+    assert validators["etag"]
+
+
+def test_huge_page_is_truncated(article_server, monkeypatch):
+    monkeypatch.setattr(extractor, "MAX_DOWNLOAD_BYTES", 100 * 1024)
+    text, truncated, _ = extractor._fetch(f"{article_server.base_url}/huge/article_5.html")
+    assert truncated
+    assert len(text.encode("utf-8")) <= 100 * 1024
+
+
+def test_non_html_is_rejected_before_download(article_server):
+    with pytest.raises(extractor.FetchRejected) as raised:
+        extractor._fetch(f"{article_server.base_url}/pdf/report.pdf")
+    assert raised.value.outcome == "content_type"
+    assert "application/pdf" in raised.value.reason
+
+
+def test_redirects_are_followed_up_to_the_limit(article_server):
+    text, _, _ = extractor._fetch(f"{article_server.base_url}/redirect/{extractor.MAX_REDIRECTS}/article_1.html")
+    assert "<html" in text.lower()
+    with pytest.raises(extractor.FetchRejected) as raised:
+        extractor._fetch(f"{article_server.base_url}/redirect/{extractor.MAX_REDIRECTS + 1}/article_1.html")
+    assert raised.value.outcome == "redirect"
+
+
+def test_error_statuses(article_server):
+    with pytest.raises(extractor.FetchRejected) as raised:
+        extractor._fetch(f"{article_server.base_url}/error/404")
+    assert raised.value.outcome == "http_404"
+    # Worth retrying: left to the scheduler
+    with pytest.raises(scheduler.TransientError):
+        extractor._fetch(f"{article_server.base_url}/error/503")
+
+
+def test_conditional_fetch(article_server):
+    url = f"{article_server.base_url}/pages/article_2.html"
+    _, _, validators = extractor._fetch(url)
+    with pytest.raises(extractor.NotModified):
+        extractor._fetch(url, validators)
+
+
+def test_extract_content_from_urls(article_server):
+    urls = [f"{article_server.base_url}/pages/article_1.html", f"{article_server.base_url}/pdf/report.pdf"]
+    articles, messages = extractor.extract_content_from_urls(urls)
+    assert [article["url"] for article in articles] == urls[:1]
+    assert articles[0]["markdown_content"]
+    assert ("warning", f"Skipped {urls[1]}: not an HTML page (application/pdf).") in messages
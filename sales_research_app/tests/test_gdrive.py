@@ -0,0 +1,125 @@
+import json
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from modules import article_store, gdrive, gemini
+
+CREDENTIALS = Credentials(token="refresh-token")
+
+
+def research(overview, competitors, urls, errors=None):
+    result = gemini.ResearchResult(
+        overview=overview, competitors=competitors,
+        articles=[gemini.Article(title=f"Title {url}", url=url) for url in urls], errors=errors or {}
+    )
+    return result.to_dict()
+
+
+def failed_research(*fields):
+    """Research where the listed fields failed and kept ResearchResult's defaults."""
+    result = gemini.ResearchResult(
+        competitors=["Initech"], articles=[gemini.Article(title="Later", url="https://news.example/3")],
+        errors={name: "Missing or empty." for name in fields}
+    ).to_dict()
+    if "overview" not in fields:
+        result["overview"] = "Acme makes widgets."
+    for name in set(fields) & {"competitors", "articles"}:
+        result[name] = []
+    return result
+
+
+def extracted(url):
+    content = f"Body of {url}"
+    return {"url": url, "title": f"Title {url}", "markdown_content": content, "content_hash": article_store.content_hash(content)}
+
+
+@pytest.fixture
+def saved(drive_server, store, request):
+    """Research for a company saved to the fake Drive; returns its find_previous_research result."""
+    company_name = f"Refresh {request.node.name}"
+    urls = ["https://news.example/1", "https://news.example/2"]
+    results = research("Acme makes widgets.", ["Globex", "Initech"], urls)
+    assert gdrive.save_research_to_drive(CREDENTIALS, company_name, results, [extracted(url) for url in urls])
+    previous = gdrive.find_previous_research(CREDENTIALS, company_name)
+    previous["company"] = company_name
+    return previous
+
+
+def file_content(drive_server, previous, file_name):
+    return drive_server.contents[previous["manifest"]["files"][file_name]["id"]].decode()
+
+
+def saved_manifest(drive_server, previous):
+    return json.loads(drive_server.contents[previous["manifest_file_id"]])
+
+
+def test_diff_research():
+    manifest = {
+        "competitors": ["Globex", "Initech"],
+        "files": {"company_overview.txt": {"content_hash": article_store.content_hash("Acme makes widgets.")}},
+        "articles": [{"url": "https://news.example/1"}, {"url": "https://news.example/2"}],
+    }
+    results = research("Acme makes widgets.", ["globex", "Umbrella"], ["https://news.example/1/?utm_source=x", "https://news.example/3"])
+    assert gdrive.new_article_urls(manifest, results) == ["https://news.example/3"]
+
+    changes = gdrive.diff_research(manifest, results, [extracted("https://news.example/3")])
+    assert changes["missing_urls"] == ["https://news.example/2"]
+    assert changes["competitors_added"] == ["Umbrella"]
+    assert changes["competitors_removed"] == ["Initech"]
+    # The overview is unchanged; competitors.txt was never saved
+    assert changes["changed_files"] == ["competitors.txt"]
+    assert changes["not_refreshed"] == []
+    assert gdrive.summarize_changes(changes) == "1 new article(s), competitors +1/-1, overview unchanged"
+
+
+def test_diff_research_ignores_failed_fields():
+    manifest = {"competitors": ["Globex"], "files": {}, "articles": [{"url": "https://news.example/1"}]}
+    changes = gdrive.diff_research(manifest, failed_research("overview", "competitors", "articles"), [])
+    assert changes["missing_urls"] == []
+    assert changes["competitors_added"] == changes["competitors_removed"] == []
+    assert changes["changed_files"] == []
+    assert changes["not_refreshed"] == ["overview", "competitors", "articles"]
+
+
+def test_refresh_updates_the_saved_folder(drive_server, saved):
+    results = research("Acme makes widgets and gadgets.", ["Globex", "Umbrella"], [
+        "https://news.example/1", "https://news.example/2", "https://news.example/3"
+    ])
+    new_urls = gdrive.new_article_urls(saved["manifest"], results)
+    changes = gdrive.refresh_research_in_drive(
+        CREDENTIALS, saved, saved["company"], results, [extracted(url) for url in new_urls]
+    )
+
+    assert changes["summary"] == "1 new article(s), competitors +1/-1, overview updated"
+    assert changes["drive_link"] == saved["folder_link"]
+    assert file_content(drive_server, saved, "company_overview.txt") == "Acme makes widgets and gadgets."
+    assert file_content(drive_server, saved, "competitors.txt") == "Globex\nUmbrella"
+    manifest = saved_manifest(drive_server, saved)
+    assert manifest["competitors"] == ["Globex", "Umbrella"]
+    assert [a["file_name"] for a in manifest["articles"]] == ["article_1.md", "article_2.md", "article_3.md"]
+    folder_files = [f["name"] for f in drive_server.files.values() if saved["folder_id"] in f.get("parents", [])]
+    assert sum(name.startswith("changes_") for name in folder_files) == 1
+
+    # Nothing new the second time: no upload and no changes file
+    previous = gdrive.find_previous_research(CREDENTIALS, saved["company"])
+    changes = gdrive.refresh_research_in_drive(CREDENTIALS, previous, saved["company"], results, [])
+    assert changes["summary"] == "0 new article(s), overview unchanged"
+    folder_files = [f["name"] for f in drive_server.files.values() if saved["folder_id"] in f.get("parents", [])]
+    assert sum(name.startswith("changes_") for name in folder_files) == 1
+
+
+def test_partial_failure_keeps_saved_research(drive_server, saved):
+    results = failed_research("overview", "competitors")
+    new_urls = gdrive.new_article_urls(saved["manifest"], results)
+    changes = gdrive.refresh_research_in_drive(
+        CREDENTIALS, saved, saved["company"], results, [extracted(url) for url in new_urls]
+    )
+
+    assert changes["summary"] == "1 new article(s), overview unchanged, not refreshed: overview, competitors"
+    assert file_content(drive_server, saved, "company_overview.txt") == "Acme makes widgets."
+    assert file_content(drive_server, saved, "competitors.txt") == "Globex\nInitech"
+    manifest = saved_manifest(drive_server, saved)
+    assert manifest["competitors"] == ["Globex", "Initech"]
+    assert manifest["files"] == saved["manifest"]["files"]
+    assert [a["url"] for a in manifest["articles"]][-1] == "https://news.example/3"
@@ -0,0 +1,122 @@
+import time
+import threading
+
+import pytest
+
+from benchmarks import fakes
+from modules import jobs, state
+
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+
+@pytest.fixture
+def redis():
+    return fakes.FakeRedis()
+
+
+@pytest.fixture
+def queue(redis):
+    return jobs.JobQueue(state.RedisStateBackend(redis), workers=2, max_jobs_per_user=2)
+
+
+def wait_for(queue, job_id, statuses=FINISHED_STATUSES, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} is still {queue.get(job_id)['status']}")
+
+
+def test_job_runs_and_reports_progress(queue):
+    def work(job, company):
+        job.progress(f"Researching {company}...")
+        job.progress("Almost done", level="warning")
+        return {"company": company}
+
+    job_id = queue.submit("alice", "Acme", work, "Acme")
+    job = wait_for(queue, job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"company": "Acme"}
+    assert queue.events(job_id) == [("info", "Researching Acme..."), ("warning", "Almost done")]
+    assert [j["id"] for j in queue.list_jobs("alice")] == [job_id]
+
+
+def test_failed_job_records_the_error(queue):
+    def work(job):
+        raise RuntimeError("Drive is down")
+
+    job = wait_for(queue, queue.submit("alice", "Acme", work))
+    assert job["status"] == "failed"
+    assert job["error"] == "Drive is down"
+    assert queue.events(job["id"])[-1] == ("error", "Job failed: Drive is down")
+
+
+def test_duplicate_and_limit(queue):
+    release = threading.Event()
+
+    def work(job):
+        release.wait(5)
+
+    first = queue.submit("alice", "Acme", work, dedup_key="acme")
+    assert queue.submit("alice", "Acme", work, dedup_key="acme") == first
+    second = queue.submit("alice", "Globex", work, dedup_key="globex")
+    with pytest.raises(jobs.JobLimitError):
+        queue.submit("alice", "Initech", work, dedup_key="initech")
+    # The limit is per user
+    other = queue.submit("bob", "Initech", lambda job: None)
+    release.set()
+    for job_id in (first, second, other):
+        assert wait_for(queue, job_id)["status"] == "done"
+    assert queue.submit("alice", "Acme", work, dedup_key="acme") != first
+
+
+def test_cancel_running_job(queue):
+    started = threading.Event()
+
+    def work(job):
+        started.set()
+        while True:
+            job.check_cancelled()
+            time.sleep(0.01)
+
+    job_id = queue.submit("alice", "Acme", work)
+    assert started.wait(5)
+    queue.cancel(job_id)
+    assert wait_for(queue, job_id)["status"] == "cancelled"
+
+
+def test_replicas_share_jobs(queue, redis):
+    release = threading.Event()
+    job_id = queue.submit("alice", "Acme", lambda job: release.wait(5) and "saved")
+    wait_for(queue, job_id, statuses=("running",))
+
+    # Another replica sees the job, and a cancel from it reaches the running replica
+    replica = jobs.JobQueue(state.RedisStateBackend(redis), workers=1, max_jobs_per_user=2)
+    assert [j["id"] for j in replica.list_jobs("alice")] == [job_id]
+    assert replica.get(job_id)["status"] == "running"
+    release.set()
+    assert wait_for(replica, job_id)["result"] == "saved"
+
+
+def test_job_of_a_stopped_replica_shows_as_interrupted(queue, monkeypatch):
+    release = threading.Event()
+    job_id = queue.submit("alice", "Acme", lambda job: release.wait(5))
+    wait_for(queue, job_id, statuses=("running",))
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + jobs.JOB_STALE_SECONDS + 1)
+    assert queue.get(job_id)["status"] == "interrupted"
+    monkeypatch.undo()
+    release.set()
+    wait_for(queue, job_id)
+
+
+def test_users_only_see_their_own_jobs(queue):
+    alice = queue.submit("alice", "Acme", lambda job: "alice's")
+    bob = queue.submit("session:0123abcd", "Acme", lambda job: "bob's")
+    wait_for(queue, alice)
+    wait_for(queue, bob)
+    assert [job["id"] for job in queue.list_jobs("alice")] == [alice]
+    assert [job["id"] for job in queue.list_jobs("session:0123abcd")] == [bob]
+    assert queue.list_jobs("anonymous") == []
@@ -0,0 +1,108 @@
+import pytest
+
+from benchmarks import fakes
+from modules import gemini
+from modules.urls import clean_url, dedupe_articles, normalize_url
+
+BASE_URL = "http://127.0.0.1:8000"
+CORPUS = fakes.load_gemini_responses()
+
+
+def parse(name):
+    text = CORPUS[name].replace("{company}", "Acme").replace("{base_url}", BASE_URL)
+    return gemini.parse_research_response(text)
+
+
+def test_corpus_is_covered():
+    assert set(CORPUS) == {"clean", "fenced_trailing_commas", "malformed", "markdown_text"}
+
+
+@pytest.mark.parametrize("name", sorted(CORPUS))
+def test_articles_are_clean_and_unique(name):
+    result = parse(name)
+    urls = [article.url for article in result.articles]
+    assert len({normalize_url(url) for url in urls}) == len(urls)
+    for url in urls:
+        assert clean_url(url) == url
+        assert "utm_" not in url
+
+
+def test_clean():
+    result = parse("clean")
+    assert result.errors == {}
+    assert result.overview.startswith("Acme is a mid-sized enterprise software vendor")
+    assert result.competitors == ["Northwind Analytics", "Contoso Data", "Fabrikam Cloud", "Tailspin Systems"]
+    assert [article.url for article in result.articles] == [
+        f"{BASE_URL}/pages/article_1.html",
+        f"{BASE_URL}/pages/article_2.html",
+        f"{BASE_URL}/slow/article_3.html",
+        f"{BASE_URL}/pages/article_4.html",
+        f"{BASE_URL}/huge/article_5.html",
+    ]
+
+
+def test_fenced_trailing_commas():
+    result = parse("fenced_trailing_commas")
+    assert result.errors == {}
+    assert result.overview == "Acme builds logistics software for mid-market shippers."
+    assert result.competitors == ["Northwind Analytics", "Contoso Data"]
+    # The wrapped duplicate of article_1 with a trailing slash and utm_campaign is dropped
+    assert [article.title for article in result.articles] == [
+        "Quarterly results beat analyst expectations", "Server error page", "Broken markup",
+    ]
+
+
+def test_malformed():
+    result = parse("malformed")
+    assert set(result.errors) == set(gemini.RESEARCH_FIELDS)
+    assert result.competitors == []
+    assert result.articles == []
+
+
+def test_markdown_text():
+    result = parse("markdown_text")
+    assert result.errors == {}
+    assert result.overview == "Acme provides payment processing for small businesses across North America."
+    assert result.competitors == ["Northwind Analytics", "Contoso Data", "Fabrikam Cloud"]
+    # Trailing periods and the parentheses around the URLs are stripped
+    assert [article.url for article in result.articles] == [
+        f"{BASE_URL}/pages/article_{i}.html" for i in (1, 2, 3)
+    ]
+
+
+def test_clean_url():
+    assert clean_url("<https://x.com/a?utm_source=g&id=7>.") == "https://x.com/a?id=7"
+    assert clean_url("[title](https://x.com/a#part)") == "https://x.com/a#part"
+    assert clean_url("https://x.com/a?gclid=1&ref=home") == "https://x.com/a"
+    # Only exact names are tracking parameters: refresh and ref_id change the page
+    assert clean_url("https://x.com/a?refresh=1&ref_id=2") == "https://x.com/a?refresh=1&ref_id=2"
+    # Parentheses that belong to the URL are kept; wrapping ones are not
+    assert clean_url("https://en.wikipedia.org/wiki/Foo_(bar)") == "https://en.wikipedia.org/wiki/Foo_(bar)"
+    assert clean_url("[Foo](https://en.wikipedia.org/wiki/Foo_(bar)).") == "https://en.wikipedia.org/wiki/Foo_(bar)"
+    assert clean_url("(https://x.com/a).") == "https://x.com/a"
+    # Queries without tracking parameters are returned as they were, not re-encoded
+    for url in ("https://x.com/a?print", "https://x.com/a?q=a%20b", "https://x.com/a?path=a/b;c"):
+        assert clean_url(url) == url
+    assert clean_url("https://x.com/a?utm_source=g&print&q=a%20b#top") == "https://x.com/a?print&q=a%20b#top"
+    assert clean_url("no url here") is None
+    assert clean_url("ftp://x.com/a") is None
+    assert clean_url("http://localhost/a") is None
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://X.com:443/a/?b=2&a=1&utm_medium=x#top") == "https://x.com/a?a=1&b=2"
+    assert normalize_url("http://x.com:80") == "http://x.com/"
+    assert normalize_url("https://x.com/a?refresh=1") != normalize_url("https://x.com/a")
+
+
+def test_dedupe_articles():
+    articles = [
+        {"title": "First", "url": "https://x.com/a?utm_source=g"},
+        {"title": "Copy", "url": "<HTTPS://X.COM/a/>"},
+        {"title": "No URL", "url": ""},
+        {"title": "Second", "url": "https://x.com/b"},
+    ]
+    assert dedupe_articles(articles) == [
+        {"title": "First", "url": "https://x.com/a"},
+        {"title": "Second", "url": "https://x.com/b"},
+    ]
@@ -0,0 +1,168 @@
+import time
+import threading
+
+import httplib2
+import pytest
+import requests
+from googleapiclient.errors import HttpError
+from google.oauth2.credentials import Credentials
+
+from modules import clients, scheduler
+
+MAX_ATTEMPTS = 3
+
+
+@pytest.fixture
+def drive(drive_server):
+    drive_server.scripted_errors.clear()
+    drive_server.retry_after = 0
+    return clients.get_service("drive", "v3", Credentials(token="test-token"))
+
+
+@pytest.fixture
+def sched():
+    backends = {
+        name: {"rate": 0, "burst": 1, "max_attempts": MAX_ATTEMPTS} for name in ("drive", "articles")
+    }
+    return scheduler.Scheduler(backends, base_delay=0.01, max_delay=0.5, breaker_failures=MAX_ATTEMPTS, breaker_reset=60)
+
+
+def list_files(drive):
+    return drive.files().list(q="name = 'scheduler-probe' and trashed=false", fields="files(id, name)").execute
+
+
+def http_error(status, retry_after=None, content=b"{}"):
+    headers = {"status": str(status)}
+    if retry_after is not None:
+        headers["retry-after"] = retry_after
+    return HttpError(httplib2.Response(headers), content)
+
+
+def test_retries_429_and_503(sched, drive, drive_server):
+    drive_server.scripted_errors.extend([429, 503])
+    assert sched.call("drive", list_files(drive)) == {"files": []}
+    assert sched.stats()["drive"] == {"calls": 1, "retries": 2, "failures": 0, "circuit_open": 0}
+
+
+def test_gives_up_after_max_attempts(sched, drive, drive_server):
+    drive_server.scripted_errors.extend([503] * (MAX_ATTEMPTS + 1))
+    with pytest.raises(HttpError) as raised:
+        sched.call("drive", list_files(drive))
+    assert raised.value.resp.status == 503
+    assert sched.stats()["drive"]["retries"] == MAX_ATTEMPTS - 1
+    assert sched.stats()["drive"]["failures"] == 1
+    assert len(drive_server.scripted_errors) == 1
+
+
+def test_client_errors_are_not_retried(sched, drive, drive_server):
+    drive_server.scripted_errors.append(400)
+    with pytest.raises(HttpError):
+        sched.call("drive", list_files(drive))
+    assert sched.stats()["drive"]["retries"] == 0
+
+
+def test_retry_after_longer_than_max_delay_fails_fast(sched, drive, drive_server):
+    drive_server.retry_after = 5
+    drive_server.scripted_errors.append(429)
+    with pytest.raises(HttpError):
+        sched.call("drive", list_files(drive))
+    assert sched.stats()["drive"]["retries"] == 0
+
+
+def test_flaky_article_is_fetched(sched, article_server):
+    url = f"{article_server.base_url}/flaky/503/2/article_1.html"
+
+    def fetch():
+        response = requests.get(url, timeout=5)
+        if response.status_code in scheduler.RETRYABLE_STATUSES:
+            raise scheduler.TransientError(f"HTTP {response.status_code}", scheduler.parse_retry_after(response.headers.get("Retry-After")))
+        response.raise_for_status()
+        return response.text
+
+    assert "<html" in sched.call("articles", fetch, breaker_key="127.0.0.1").lower()
+    assert sched.stats()["articles"]["retries"] == 2
+
+
+def test_circuit_opens_after_repeated_failures(sched):
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise scheduler.TransientError("HTTP 503")
+
+    with pytest.raises(scheduler.TransientError):
+        sched.call("articles", failing, breaker_key="down.example")
+    assert len(calls) == MAX_ATTEMPTS # breaker_failures
+    with pytest.raises(scheduler.CircuitOpenError):
+        sched.call("articles", failing, breaker_key="down.example")
+    assert len(calls) == MAX_ATTEMPTS
+    assert sched.stats()["articles"]["circuit_open"] == 1
+    # Other hosts are unaffected
+    assert sched.call("articles", lambda: "ok", breaker_key="up.example") == "ok"
+
+
+def test_deadline_stops_retries(sched):
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        raise scheduler.TransientError("HTTP 429", retry_after=0.4)
+
+    with pytest.raises(scheduler.TransientError):
+        sched.call("articles", failing, deadline=time.monotonic() + 0.1)
+    assert len(attempts) == 1
+
+
+def test_call_waiting_for_its_slot_holds_no_budget():
+    sched = scheduler.Scheduler({"articles": {"rate": 0, "burst": 1, "max_attempts": 1}}, max_in_flight=1)
+    host_slot = threading.BoundedSemaphore(1)
+    host_slot.acquire() # Another fetch from the same host is running
+    waiting = threading.Thread(target=sched.call, args=("articles", lambda: "late"), kwargs={"slot": host_slot})
+    waiting.start()
+    time.sleep(0.05)
+    # The only budget slot is still free for other calls
+    finished = []
+    other = threading.Thread(target=lambda: finished.append(sched.call("articles", lambda: "ok")))
+    other.start()
+    other.join(1)
+    assert finished == ["ok"]
+    host_slot.release()
+    waiting.join(1)
+    assert not waiting.is_alive()
+
+
+def test_slot_is_released_during_backoff():
+    sched = scheduler.Scheduler({"articles": {"rate": 0, "burst": 1, "max_attempts": 2}}, max_delay=1)
+    host_slot = threading.BoundedSemaphore(1)
+    attempts, acquired = [], []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise scheduler.TransientError("HTTP 503", retry_after=0.3)
+        return "ok"
+
+    def probe():
+        time.sleep(0.1) # During the backoff after the first attempt
+        if host_slot.acquire(timeout=0.1):
+            acquired.append(True)
+            host_slot.release()
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    assert sched.call("articles", flaky, slot=host_slot) == "ok"
+    prober.join()
+    assert acquired == [True]
+
+
+@pytest.mark.parametrize("error, expected", [
+    (http_error(429, "3"), (True, 3.0)),
+    (http_error(503), (True, None)),
+    (http_error(404), (False, None)),
+    (http_error(403, content=b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}'), (True, None)),
+    (http_error(403, content=b'{"error": {"errors": [{"reason": "forbidden"}]}}'), (False, None)),
+    (requests.exceptions.ConnectionError(), (True, None)),
+    (ValueError("bad"), (False, None)),
+])
+def test_classify(error, expected):
+    assert scheduler.classify(error) == expected
@@ -0,0 +1,114 @@
+import time
+import threading
+
+import pytest
+from cryptography.fernet import Fernet
+
+from modules import state
+
+
+@pytest.fixture
+def later(monkeypatch):
+    """Moves the clock forward by the given number of seconds."""
+    now = time.time()
+    return lambda seconds: monkeypatch.setattr(time, "time", lambda: now + seconds)
+
+
+def test_set_get_delete(backend):
+    assert backend.get("k") is None
+    backend.set("k", b"v")
+    assert backend.get("k") == b"v"
+    backend.delete("k")
+    assert backend.get("k") is None
+
+
+def test_values_expire(backend, later):
+    backend.set("k", b"v", ttl=10)
+    later(11)
+    assert backend.get("k") is None
+    assert backend.pop("k") is None
+    assert backend.set_if_absent("k", b"w", ttl=10)
+
+
+def test_set_if_absent(backend):
+    assert backend.set_if_absent("k", b"first")
+    assert not backend.set_if_absent("k", b"second")
+    assert backend.get("k") == b"first"
+
+
+def test_pop_returns_the_value_once(backend):
+    backend.set("k", b"v")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(backend.pop("k"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results, key=bool) == [None] * 7 + [b"v"]
+
+
+def test_delete_if_equals(backend):
+    backend.set("k", b"mine")
+    backend.delete_if_equals("k", b"theirs")
+    assert backend.get("k") == b"mine"
+    backend.delete_if_equals("k", b"mine")
+    assert backend.get("k") is None
+
+
+def test_json(backend):
+    backend.set_json("k", {"a": [1, 2]})
+    assert backend.get_json("k") == {"a": [1, 2]}
+
+
+def test_lock_excludes_other_holders(backend):
+    with backend.lock("name", ttl=30, timeout=1):
+        with pytest.raises(state.LockTimeout):
+            with backend.lock("name", ttl=30, timeout=0.1):
+                pass
+    with backend.lock("name", ttl=30, timeout=0.1):
+        pass
+
+
+def test_expired_lock_is_not_released_by_its_old_holder(backend, later):
+    with backend.lock("name", ttl=10, timeout=1):
+        later(11)
+        # Another replica takes the expired lock before the first holder finishes
+        assert backend.set_if_absent("lock:name", b"other", ttl=10)
+    assert backend.get("lock:name") == b"other"
+
+
+def test_secret_box(backend):
+    box = state.SecretBox(backend, Fernet.generate_key())
+    box.set("k", {"token": "secret"})
+    assert b"secret" not in backend.get("k")
+    assert box.get("k") == {"token": "secret"}
+    assert box.pop("k") == {"token": "secret"}
+    assert box.pop("k") is None
+
+
+def test_secret_box_with_another_key(backend):
+    state.SecretBox(backend, Fernet.generate_key()).set("k", {"token": "secret"})
+    assert state.SecretBox(backend, Fernet.generate_key()).get("k") is None
+
+
+def test_sqlite_purges_expired_rows(tmp_path, later):
+    backend = state.SQLiteStateBackend(str(tmp_path / "state.sqlite3"), purge_every=3)
+    backend.set("old", b"v", ttl=10)
+    backend.set("kept", b"v")
+    later(11)
+    backend.set("new", b"v", ttl=10)
+    keys = [row[0] for row in backend._conn.execute("SELECT key FROM state ORDER BY key")]
+    assert keys == ["kept", "new"]
+
+
+def test_replicas_starting_together_share_one_key(tmp_path):
+    path = str(tmp_path / "state.key")
+    keys = []
+    threads = [threading.Thread(target=lambda: keys.append(state._load_encryption_key(path))) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(keys)) == 1
+    Fernet(keys[0])
+    assert [p.name for p in tmp_path.iterdir()] == ["state.key"]
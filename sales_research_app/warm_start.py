@@ -0,0 +1,25 @@
+"""
+Starts the Streamlit app with the process already warming up, so the first visitor
+after a container restart doesn't wait for imports, databases and worker processes.
+
+Usage (accepts the same options as `streamlit run`):
+    python warm_start.py --server.port 8501
+
+Set WARMUP_ON_START=false to skip the warm-up.
+"""
+import os
+import sys
+
+from modules import warmup
+
+
+def main():
+    warmup.start()
+    from streamlit.web import cli
+    # Same as the `streamlit run app.py` command, but in this already warming process
+    sys.argv = ["streamlit", "run", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")] + sys.argv[1:]
+    return cli.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())